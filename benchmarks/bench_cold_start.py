@@ -0,0 +1,57 @@
+"""Cold-start time to the first served layout, with and without the main table snapshot
+
+Each run starts a fresh interpreter that imports the app (which loads the main
+table of the application database) and renders the layout once. The snapshot
+is removed for the "before" runs and written by DataStore.write_snapshot for
+the "after" runs, so it is left in place afterwards.
+
+Usage: python benchmarks/bench_cold_start.py [runs]
+"""
+
+import json
+import subprocess
+import sys
+import time
+
+from innov8.db_ops import DataStore, data
+
+STARTUP = """
+import json, time
+start = time.perf_counter()
+from innov8.layout import layout
+imported = time.perf_counter()
+layout()
+served = time.perf_counter()
+print(json.dumps({"import": imported - start, "layout": served - imported}))
+"""
+
+
+def cold_start() -> dict[str, float]:
+    result = subprocess.run(
+        [sys.executable, "-c", STARTUP], capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def main(runs: int = 5) -> None:
+    print(f"{len(data.main_table)} rows, {len(data.symbol_index)} tickers")
+    print(f"{'':>16} {'DataStore()':>12} {'import':>8} {'layout':>8} {'total':>8}  (s)")
+    for label in ("before (SQL)", "after (snapshot)"):
+        if label.startswith("before"):
+            data.snapshot_path.unlink(missing_ok=True)
+        else:
+            data.write_snapshot()
+        start = time.perf_counter()
+        DataStore(data.script_directory)
+        init = time.perf_counter() - start
+        timings = min(
+            (cold_start() for _ in range(runs)), key=lambda t: t["import"] + t["layout"]
+        )
+        print(
+            f"{label:>16} {init:>12.3f} {timings['import']:>8.3f} {timings['layout']:>8.3f}"
+            f" {timings['import'] + timings['layout']:>8.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:2]))
@@ -0,0 +1,91 @@
+"""Speed and accuracy of the forecast engines on the stored history
+
+The last 5 bars of every ticker in the application database are held out,
+each engine forecasts them from the preceding history and the predictions are
+compared with the actual prices. A naive forecast (repeating the last bar)
+is included for reference.
+
+Usage: python benchmarks/bench_forecast_engines.py [--prophet-symbols N] [--jobs N]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from innov8.db_ops import data
+from innov8.forecasting import PERIODS, PRICE_TYPES, load_engine
+
+
+def mape(predicted: np.ndarray, actual: np.ndarray) -> np.ndarray:
+    # Mean absolute percentage error per price type
+    return (np.abs(predicted - actual) / actual).mean(axis=(0, 1)) * 100
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--prophet-symbols",
+        type=int,
+        default=50,
+        help="Number of tickers forecast with Prophet (it is slow)",
+    )
+    parser.add_argument("--jobs", type=int, default=1)
+    args = parser.parse_args()
+
+    histories, actual = {}, {}
+    for symbol in data.symbol_index:
+        frame = data.get_symbol_frame(symbol)[["date", *PRICE_TYPES]]
+        if len(frame) > 2 * PERIODS:
+            histories[symbol] = frame.iloc[:-PERIODS]
+            actual[symbol] = frame[PRICE_TYPES].iloc[-PERIODS:].to_numpy()
+
+    print(
+        f"{'engine':>10} {'tickers':>8} {'seconds':>9} {'ms/ticker':>10} | MAPE % "
+        + " ".join(f"{p:>6}" for p in PRICE_TYPES)
+    )
+    subsets = {
+        "naive": list(histories),
+        "smoothing": list(histories),
+        "prophet": list(histories)[: args.prophet_symbols],
+    }
+    for engine, symbols in subsets.items():
+        start = time.perf_counter()
+        if engine == "naive":
+            forecasts = {
+                symbol: np.repeat(
+                    histories[symbol][PRICE_TYPES].to_numpy()[-1:], PERIODS, axis=0
+                )
+                for symbol in symbols
+            }
+        else:
+            forecasts = {
+                symbol: np.array(rows)[:, 1:]
+                for symbol, rows in load_engine(engine).forecast_many(
+                    {symbol: histories[symbol] for symbol in symbols}, args.jobs
+                )
+            }
+        elapsed = time.perf_counter() - start
+        errors = mape(
+            np.stack([forecasts[symbol] for symbol in symbols]),
+            np.stack([actual[symbol] for symbol in symbols]),
+        )
+        print(
+            f"{engine:>10} {len(symbols):>8} {elapsed:>9.2f} {elapsed / len(symbols) * 1000:>10.2f} |        "
+            + " ".join(f"{e:>6.2f}" for e in errors)
+        )
+        # Compare the other engines on the Prophet subset as well
+        if engine != "prophet" and len(symbols) > args.prophet_symbols:
+            subset = subsets["prophet"]
+            errors = mape(
+                np.stack([forecasts[symbol] for symbol in subset]),
+                np.stack([actual[symbol] for symbol in subset]),
+            )
+            print(
+                f"{'':>10} {len(subset):>8} {'':>9} {'':>10} |        "
+                + " ".join(f"{e:>6.2f}" for e in errors)
+            )
+
+
+if __name__ == "__main__":
+    main()
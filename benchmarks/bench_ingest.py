@@ -0,0 +1,114 @@
+"""Price insert throughput of DataStore.insert_ohlc_many
+
+Compares inserts resolving the ticker and date ids with correlated subqueries
+per row (before) with inserts using the in-memory id maps (after), on an empty
+database filled with synthetic data in chunks of OHLC_CHUNK_SIZE tickers.
+
+Usage: python benchmarks/bench_ingest.py [n_tickers] [n_years]
+"""
+
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import pandas as pd
+from synthetic import make_ohlc, make_symbols
+
+from innov8.db_ops import OHLC_CHUNK_SIZE, DataStore
+
+
+class EmptyStore(DataStore):
+    # A fresh database holding only the ticker dimension
+    def __init__(self, directory: Path, symbols: list[str]):
+        self.db_path = directory / "stonks.db"
+        self.lock = threading.Lock()
+        self.con = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.cur = self.con.cursor()
+        self.create_tables()
+        with self.con:
+            self.con.execute("INSERT INTO currency (iso_code) VALUES ('USD')")
+            self.con.execute("INSERT INTO exchange (name) VALUES ('NMS')")
+            self.con.execute("INSERT INTO ticker_type (name) VALUES ('EQUITY')")
+            self.con.execute("INSERT INTO sector (name) VALUES ('Technology')")
+            self.con.executemany(
+                """
+                INSERT INTO ticker (name, symbol, currency_id, exchange_id, ticker_type_id, sector_id)
+                VALUES (?, ?, 1, 1, 1, 1)
+                """,
+                [(f"{symbol} Inc.", symbol) for symbol in symbols],
+            )
+        self.load_ids()
+
+
+class SubqueryStore(EmptyStore):
+    # The previous inserts: ids resolved by the database for every row
+    def insert_ohlc_many(self, ohlc_data: dict[str, pd.DataFrame]) -> None:
+        records = []
+        for symbol, frame in ohlc_data.items():
+            frame = frame.set_axis(frame.index.astype("int64") / 10**9).rename_axis(
+                "Date"
+            )
+            records += [
+                record | {"symbol": symbol}
+                for record in frame.reset_index().to_dict(orient="records")
+            ]
+        with self.lock:
+            with self.con:
+                self.con.executemany(
+                    "INSERT OR IGNORE INTO date (date) VALUES (:Date)", records
+                )
+                self.con.executemany(
+                    """
+                    INSERT INTO price (ticker_id, date_id, open, high, low, close, volume)
+                    VALUES (
+                        (SELECT id FROM ticker WHERE symbol = :symbol),
+                        (SELECT id FROM date WHERE date = :Date),
+                        :Open, :High, :Low, :Close, :Volume
+                    )
+                    """,
+                    records,
+                )
+
+
+def make_frames(n_tickers: int, n_days: int) -> dict[str, pd.DataFrame]:
+    # Per-symbol frames shaped like the yfinance output
+    dates = pd.bdate_range(end="2024-06-28", periods=n_days, name="Date")
+    ohlc = make_ohlc(n_tickers, n_days)
+    return {
+        symbol: pd.DataFrame(
+            {column.title(): values[i] for column, values in ohlc.items()},
+            index=dates,
+        )
+        for i, symbol in enumerate(make_symbols(n_tickers))
+    }
+
+
+def main(n_tickers: int = 500, n_years: int = 10) -> None:
+    frames = make_frames(n_tickers, 252 * n_years)
+    symbols = list(frames)
+    chunks = [
+        {symbol: frames[symbol] for symbol in symbols[i : i + OHLC_CHUNK_SIZE]}
+        for i in range(0, len(symbols), OHLC_CHUNK_SIZE)
+    ]
+    rows = sum(map(len, frames.values()))
+    print(f"{n_tickers} tickers x {n_years} years = {rows} rows")
+    for store_class in (SubqueryStore, EmptyStore):
+        with tempfile.TemporaryDirectory() as directory:
+            store = store_class(Path(directory), symbols)
+            start = time.perf_counter()
+            for chunk in chunks:
+                store.insert_ohlc_many(chunk)
+            elapsed = time.perf_counter() - start
+            stored = store.con.execute("SELECT COUNT(*) FROM price").fetchone()[0]
+            assert stored == rows
+            store.con.close()
+        print(
+            f"{store_class.__name__:>14}: {elapsed:>7.2f} s {rows / elapsed:>12,.0f} rows/s"
+        )
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:3]))
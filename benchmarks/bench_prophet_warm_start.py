@@ -0,0 +1,64 @@
+"""Prophet refit time from a cold start and warm-started from the previous fit
+
+Mimics a daily update: every ticker in the application database is first fitted
+without its last bar (the parameters of these fits are kept, as generate_forecasts
+stores them), then refitted on its full history, once from Prophet's default
+initialization and once warm-started from the kept parameters. The largest
+difference between the cold and warm forecasts is reported as well.
+
+Usage: python benchmarks/bench_prophet_warm_start.py [--symbols N] [--jobs N]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from innov8.db_ops import data
+from innov8.forecasting import PRICE_TYPES, load_engine
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--symbols", type=int, default=None, help="Number of tickers (default: all)"
+    )
+    parser.add_argument("--jobs", type=int, default=1)
+    args = parser.parse_args()
+    engine = load_engine("prophet")
+
+    histories = {
+        symbol: data.get_symbol_frame(symbol)[["date", *PRICE_TYPES]]
+        for symbol in list(data.symbol_index)[: args.symbols]
+    }
+    params = {}
+    for _ in engine.forecast_many(
+        {symbol: history.iloc[:-1] for symbol, history in histories.items()},
+        args.jobs,
+        params,
+    ):
+        pass
+
+    print(f"{'fit':>6} {'tickers':>8} {'seconds':>9} {'ms/ticker':>10}")
+    forecasts = {}
+    for label, init in (("cold", None), ("warm", params)):
+        start = time.perf_counter()
+        forecasts[label] = {
+            symbol: np.array(rows)[:, 1:]
+            for symbol, rows in engine.forecast_many(histories, args.jobs, init)
+        }
+        elapsed = time.perf_counter() - start
+        print(
+            f"{label:>6} {len(histories):>8} {elapsed:>9.2f} {elapsed / len(histories) * 1000:>10.2f}"
+        )
+    difference = max(
+        np.abs(forecasts["warm"][symbol] / cold - 1).max()
+        for symbol, cold in forecasts["cold"].items()
+    )
+    print(
+        f"largest relative difference between cold and warm forecasts: {difference:.2e}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Intra-sector correlation cost for the largest sector of a large universe
+
+Compares, for the largest sector of a synthetic universe:
+- the previous per-request path: filtering the sector, pivoting the 90-day window
+  and DataFrame.corr()
+- building the rolling correlations of every window from scratch
+- appending one new daily bar for every symbol of the sector to them
+
+Usage: python benchmarks/bench_rolling_correlation.py [n_tickers]
+"""
+
+import copy
+import datetime
+import sys
+import time
+import timeit
+
+import numpy as np
+import pandas as pd
+from synthetic import make_main_table
+
+from innov8.analytics import WINDOWS, SectorCorrelations, close_matrix
+
+REPEAT = 5
+
+
+def pivot_corr(main_table: pd.DataFrame, sector: str) -> pd.DataFrame:
+    # The correlations as computed before
+    sector_table = main_table.loc[
+        main_table.sector == sector, ["symbol", "date", "close"]
+    ]
+    end_date = sector_table.groupby("symbol", observed=True).date.max().min()
+    sector_table = sector_table[sector_table.date >= end_date - datetime.timedelta(90)]
+    return sector_table.pivot(columns="symbol", index="date", values="close").corr()
+
+
+def main(n_tickers: int = 5_000) -> None:
+    main_table = make_main_table(n_tickers)
+    sector = main_table.sector.value_counts().index[0]
+    sector_rows = main_table.loc[main_table.sector == sector]
+    sector_rows = sector_rows.assign(
+        symbol=sector_rows.symbol.cat.remove_unused_categories()
+    )
+    symbols = sector_rows.symbol.cat.categories
+    print(
+        f"{n_tickers} tickers, largest sector: {len(symbols)} tickers"
+        f" ({len(symbols) * (len(symbols) - 1) // 2} pairs), windows {tuple(WINDOWS)}"
+    )
+
+    best = min(
+        timeit.repeat(lambda: pivot_corr(main_table, sector), number=1, repeat=REPEAT)
+    )
+    print(f"{'pivot + corr (90 days)':>28}: {best * 1000:>9.2f} ms")
+    best = min(
+        timeit.repeat(
+            lambda: SectorCorrelations(*close_matrix(sector_rows)),
+            number=1,
+            repeat=REPEAT,
+        )
+    )
+    print(f"{'build (all windows)':>28}: {best * 1000:>9.2f} ms")
+
+    # A new bar for every symbol of the sector
+    correlations = SectorCorrelations(*close_matrix(sector_rows))
+    new_rows = pd.DataFrame(
+        {
+            "symbol": symbols,
+            "date": correlations.end + pd.offsets.BDay(),
+            "close": np.random.default_rng(0).uniform(50, 150, len(symbols)),
+        }
+    )
+    timings = []
+    for _ in range(REPEAT):
+        fresh = copy.deepcopy(correlations)
+        start = time.perf_counter()
+        assert fresh.update(new_rows)
+        timings.append(time.perf_counter() - start)
+    print(f"{'append one bar (all windows)':>28}: {min(timings) * 1000:>9.2f} ms")
+    start = time.perf_counter()
+    fresh.table(90)
+    print(
+        f"{'table after append (90 days)':>28}: {(time.perf_counter() - start) * 1000:>9.2f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:2]))
@@ -0,0 +1,74 @@
+"""Per-symbol lookup and callback latency against universe size
+
+Compares the boolean-mask scan over main_table (before) with the per-symbol
+row index (after), both for the bare lookup and for the symbol-driven callbacks.
+
+Usage: python benchmarks/bench_symbol_index.py [n_tickers ...]
+"""
+
+import sys
+import timeit
+
+import pandas as pd
+from synthetic import make_main_table
+
+from innov8.components.charts_52w import weekly_traces
+from innov8.components.price_card import update_symbol_data
+from innov8.components.price_chart import series_payload
+from innov8.db_ops import DataStore
+from innov8.decorators import data_access
+
+REPEAT = 20
+
+
+class IndexedStore(DataStore):
+    # Skip the database, only keep what the callbacks read
+    def __init__(self, main_table: pd.DataFrame):
+        self.set_main_table(main_table)
+
+
+class MaskedStore(IndexedStore):
+    # The pre-index lookup: a full boolean-mask scan of main_table
+    def get_symbol_frame(self, symbol: str) -> pd.DataFrame:
+        assert self.main_table is not None
+        return self.main_table.loc[self.main_table.symbol == symbol]
+
+
+def time_ms(func) -> float:
+    # Best of REPEAT runs, in milliseconds
+    return min(timeit.repeat(func, number=1, repeat=REPEAT)) * 1000
+
+
+def callbacks(store: DataStore, symbol: str) -> None:
+    # The per-symbol work of the callbacks, bypassing their payload caches
+    series_payload(store, symbol, 9, 50)
+    update_symbol_data(symbol, None)
+    weekly_traces(store.get_symbol_frame(symbol))
+
+
+def main(sizes: list[int]) -> None:
+    print(
+        f"{'tickers':>8} {'rows':>10} | {'lookup before':>13} {'lookup after':>12}"
+        f" | {'callbacks before':>16} {'callbacks after':>15}  (ms)"
+    )
+    for n_tickers in sizes:
+        main_table = make_main_table(n_tickers)
+        symbol = main_table.symbol.cat.categories[n_tickers // 2]
+        results = []
+        for store in (MaskedStore(main_table), IndexedStore(main_table)):
+            data_access.data = store  # callbacks receive this instance
+            results.append(
+                (
+                    time_ms(lambda: store.get_symbol_frame(symbol)),
+                    time_ms(lambda: callbacks(store, symbol)),
+                )
+            )
+        (lookup_before, cb_before), (lookup_after, cb_after) = results
+        print(
+            f"{n_tickers:>8} {len(main_table):>10} | {lookup_before:>13.3f} {lookup_after:>12.3f}"
+            f" | {cb_before:>16.2f} {cb_after:>15.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main([int(n) for n in sys.argv[1:]] or [500, 5_000, 10_000])
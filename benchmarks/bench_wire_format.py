@@ -0,0 +1,116 @@
+"""Price chart payload size and decoding cost, row records vs columnar series
+
+For one symbol of a synthetic universe with 1 to 10 years of history, compares the
+seriesData of update_price_chart sent as row records (before) with the columnar
+encoding expanded in the browser by EXPAND_SERIES (after):
+- response bytes, raw and gzip-compressed (as served with compression)
+- server-side encoding (series_payload + JSON serialization)
+- browser-side decoding, timed with Node.js when available: JSON.parse of the
+  response, plus EXPAND_SERIES for the columnar one
+
+Chart rendering itself (dash_tvlwc drawing the same rows) is unchanged and is not
+measured, it needs a real browser.
+
+Usage: python benchmarks/bench_wire_format.py [n_years ...]
+"""
+
+import gzip
+import json
+import shutil
+import subprocess
+import sys
+import tempfile
+import timeit
+from pathlib import Path
+
+import pandas as pd
+import plotly
+from synthetic import make_main_table
+
+from innov8.components.price_chart import EXPAND_SERIES, series_payload
+from innov8.db_ops import DataStore
+
+REPEAT = 20
+
+NODE_SCRIPT = """
+const fs = require("fs");
+const expandSeries = %s;
+const [records, columns] = process.argv.slice(1).map((p) => fs.readFileSync(p, "utf8"));
+function best(func) {
+    let best = Infinity;
+    for (let i = 0; i < %d; i++) {
+        const start = process.hrtime.bigint();
+        func();
+        best = Math.min(best, Number(process.hrtime.bigint() - start) / 1e6);
+    }
+    return best;
+}
+const expanded = expandSeries(JSON.parse(columns));
+if (expanded[1].length !== JSON.parse(records)[1].length) throw new Error("length mismatch");
+console.log(JSON.stringify([
+    best(() => JSON.parse(records)),
+    best(() => expandSeries(JSON.parse(columns))),
+]));
+"""
+
+
+class IndexedStore(DataStore):
+    # Skip the database, only keep what the callbacks read
+    def __init__(self, main_table: pd.DataFrame):
+        self.set_main_table(main_table)
+
+
+def to_json(series_data: list) -> str:
+    # As serialized by Dash
+    return json.dumps(series_data, cls=plotly.utils.PlotlyJSONEncoder)
+
+
+def time_ms(func) -> float:
+    # Best of REPEAT runs, in milliseconds
+    return min(timeit.repeat(func, number=1, repeat=REPEAT)) * 1000
+
+
+def decode_ms(records: str, columns: str) -> tuple[float, float] | None:
+    if shutil.which("node") is None:
+        return None
+    with tempfile.TemporaryDirectory() as directory:
+        paths = [Path(directory) / "records.json", Path(directory) / "columns.json"]
+        for path, payload in zip(paths, (records, columns)):
+            path.write_text(payload)
+        result = subprocess.run(
+            ["node", "-e", NODE_SCRIPT % (EXPAND_SERIES, REPEAT), *map(str, paths)],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    return tuple(json.loads(result.stdout))
+
+
+def main(years: list[int]) -> None:
+    print(
+        f"{'years':>5} {'bars':>5} | {'bytes':>9} {'gzip':>7} {'encode':>7} {'decode':>7}"
+        f" | {'bytes':>9} {'gzip':>7} {'encode':>7} {'decode':>7}  (records | columnar, ms)"
+    )
+    for n_years in years:
+        store = IndexedStore(make_main_table(10, 252 * n_years))
+        symbol = store.main_table.symbol.cat.categories[0]
+        results = []
+        for columnar in (False, True):
+            payload = to_json(series_payload(store, symbol, 9, 50, columnar)[1])
+            encode = time_ms(
+                lambda: to_json(series_payload(store, symbol, 9, 50, columnar)[1])
+            )
+            results.append((payload, encode))
+        (records, encode_records), (columns, encode_columns) = results
+        decode = decode_ms(records, columns) or (float("nan"), float("nan"))
+        print(
+            f"{n_years:>5} {252 * n_years:>5}"
+            f" | {len(records):>9,} {len(gzip.compress(records.encode())):>7,}"
+            f" {encode_records:>7.2f} {decode[0]:>7.2f}"
+            f" | {len(columns):>9,} {len(gzip.compress(columns.encode())):>7,}"
+            f" {encode_columns:>7.2f} {decode[1]:>7.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [1, 5, 10])
@@ -0,0 +1,55 @@
+"""Synthetic market data for benchmarks (random walks, no network access needed)"""
+
+import numpy as np
+import pandas as pd
+
+SECTORS = [
+    "Basic Materials",
+    "Communication Services",
+    "Consumer Cyclical",
+    "Consumer Defensive",
+    "Energy",
+    "Financial Services",
+    "Healthcare",
+    "Industrials",
+    "Real Estate",
+    "Technology",
+    "Utilities",
+]
+
+
+def make_symbols(n_tickers: int) -> list[str]:
+    return [f"T{i:05d}" for i in range(n_tickers)]
+
+
+def make_ohlc(
+    n_tickers: int, n_days: int = 252, seed: int = 0
+) -> dict[str, np.ndarray]:
+    """Random-walk OHLCV arrays of shape (n_tickers, n_days)"""
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, (n_tickers, n_days)), axis=1))
+    open_ = close * (1 + rng.normal(0, 0.01, close.shape))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.01, close.shape)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.01, close.shape)))
+    volume = rng.integers(100_000, 10_000_000, close.shape)
+    return {"open": open_, "high": high, "low": low, "close": close, "volume": volume}
+
+
+def make_main_table(n_tickers: int, n_days: int = 252, seed: int = 0) -> pd.DataFrame:
+    """A DataFrame shaped like DataStore.main_table"""
+    symbols = make_symbols(n_tickers)
+    dates = pd.bdate_range(end="2024-06-28", periods=n_days)
+    ohlc = make_ohlc(n_tickers, n_days, seed)
+    sectors = [SECTORS[i % len(SECTORS)] for i in range(n_tickers)]
+    return pd.DataFrame(
+        {
+            "symbol": pd.Categorical(np.repeat(symbols, n_days)),
+            "name": pd.Categorical(np.repeat([f"{s} Inc." for s in symbols], n_days)),
+            "sector": pd.Categorical(np.repeat(sectors, n_days)),
+            "date": np.tile(dates, n_tickers),
+            **{column: values.ravel() for column, values in ohlc.items()},
+            "exchange": pd.Categorical(["NMS"] * (n_tickers * n_days)),
+            "type": pd.Categorical(["EQUITY"] * (n_tickers * n_days)),
+            "currency": pd.Categorical(["USD"] * (n_tickers * n_days)),
+        }
+    )
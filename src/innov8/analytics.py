@@ -0,0 +1,249 @@
+"""Universe-wide analytics, updated as new rows are loaded
+
+The closing prices of all tickers are pivoted into a single (date x symbol) matrix, from
+which the intra-sector correlations and latest prices of every sector are derived.
+Correlations are kept as running sums per pair of symbols (see RollingCorrelation), so
+that new daily bars update them in O(pairs) instead of re-pivoting the window.
+Results are memoized per database and loaded rows, and optionally shared between
+processes (e.g. gunicorn workers) through a diskcache.Cache.
+"""
+
+import threading
+from collections import deque
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+# Selectable windows of the intra-sector correlations (calendar days) and their labels
+WINDOWS = {30: "30-day", 90: "90-day", 180: "180-day", 365: "1-year"}
+CORRELATION_DAYS = 90
+
+
+# Pivot the closing prices of main_table into a (date x symbol) matrix (NaN where missing)
+def close_matrix(
+    main_table: pd.DataFrame,
+) -> tuple[pd.DatetimeIndex, pd.Index, np.ndarray]:
+    dates, date_codes = np.unique(main_table.date.to_numpy(), return_inverse=True)
+    symbols = main_table.symbol.cat.categories
+    matrix = np.full((len(dates), len(symbols)), np.nan)
+    matrix[date_codes, main_table.symbol.cat.codes.to_numpy()] = main_table.close
+    return pd.DatetimeIndex(dates), symbols, matrix
+
+
+# Last present value of each column of `x` (NaN if there is none)
+def last_present(x: np.ndarray) -> np.ndarray:
+    return pd.DataFrame(x).ffill().to_numpy()[-1]
+
+
+# Pearson correlations between the columns of `x`, each pair over the rows where both
+# are present (like DataFrame.corr)
+def masked_correlation(x: np.ndarray) -> np.ndarray:
+    engine = RollingCorrelation(0, np.nan_to_num(last_present(x)))
+    engine.add(x)
+    return engine.correlation()
+
+
+class RollingCorrelation:
+    """Pairwise correlations of k series over a trailing window of `days` calendar days
+
+    For every pair the number of rows where both series are present and the sums of
+    x, x² and xy over those rows are kept, so adding or evicting a row costs O(k²).
+    """
+
+    def __init__(self, days: int, shift: np.ndarray):
+        self.days = days
+        # Values are offset by a reference level of each series, which does not change
+        # correlations but keeps the running sums well conditioned
+        self.shift = shift
+        k = len(shift)
+        self.n = np.zeros((k, k))
+        self.sum_x = np.zeros((k, k))  # sum of series i over the rows shared with j
+        self.sum_xx = np.zeros((k, k))
+        self.sum_xy = np.zeros((k, k))
+        self.rows: deque[tuple[pd.Timestamp, np.ndarray]] = deque()
+
+    # Add the sums of a (rows x k) block, rows with a negative `sign` are removed
+    def add(self, x: np.ndarray, sign: np.ndarray | int = 1) -> None:
+        present = ~np.isnan(x)
+        x = np.where(present, x - self.shift, 0)
+        m = present.astype(float)
+        sign = np.reshape(sign, (-1, 1))
+        signed_m, signed_x = m * sign, x * sign
+        self.n += signed_m.T @ m
+        self.sum_x += signed_x.T @ m
+        self.sum_xx += (x * x).T @ signed_m
+        self.sum_xy += x.T @ signed_x
+
+    # Append rows (in date order), evicting those that fall out of the window
+    def extend(self, dates: pd.DatetimeIndex, x: np.ndarray) -> None:
+        if not len(dates):
+            return
+        self.rows.extend(zip(dates, x))
+        start = dates[-1] - pd.Timedelta(days=self.days)
+        expired = []
+        while self.rows[0][0] < start:
+            expired.append(self.rows.popleft()[1])
+        # Rows appended and evicted at once are added and removed in one pass
+        self.add(
+            np.vstack([x, *expired]), np.r_[np.ones(len(x)), -np.ones(len(expired))]
+        )
+
+    def correlation(self) -> np.ndarray:
+        n, sum_x = self.n, self.sum_x
+        with np.errstate(divide="ignore", invalid="ignore"):
+            covariance = n * self.sum_xy - sum_x * sum_x.T
+            variance = n * self.sum_xx - sum_x * sum_x
+            corr = covariance / np.sqrt(variance * variance.T)
+        return np.clip(corr, -1, 1)
+
+    # Last value of each series within the window
+    def last(self) -> np.ndarray:
+        return last_present(np.array([row for _, row in self.rows]))
+
+
+class SectorCorrelations:
+    """Rolling correlations and latest prices of a sector's symbols for each of WINDOWS
+
+    Windows end at the latest date shared by all symbols of the sector, bars of later
+    dates are held back until every symbol has caught up.
+    """
+
+    def __init__(self, dates: pd.DatetimeIndex, symbols: pd.Index, closes: np.ndarray):
+        # Only the dates on which the sector traded
+        traded = ~np.isnan(closes).all(axis=1)
+        dates, closes = dates[traded], closes[traded]
+        self.symbols = symbols.astype(str)
+        self.columns = {symbol: i for i, symbol in enumerate(self.symbols)}
+        present = ~np.isnan(closes)
+        last = len(dates) - 1 - present[::-1].argmax(axis=0)
+        self.last_dates = dates[last].to_numpy()
+        end = last.min()
+        self.end = dates[end]
+        shift = np.nan_to_num(last_present(closes[: end + 1]))
+        self.windows = {}
+        for days in WINDOWS:
+            start = dates.searchsorted(self.end - pd.Timedelta(days=days))
+            self.windows[days] = RollingCorrelation(days, shift)
+            self.windows[days].extend(dates[start : end + 1], closes[start : end + 1])
+        # Rows after the shared end date
+        self.pending = dict(zip(dates[end + 1 :], closes[end + 1 :]))
+        self.tables: dict[int, tuple[pd.DataFrame, pd.Series]] = {}
+
+    # Add new bars (symbol, date and close columns), returns False if they cannot simply
+    # be appended (new symbols or dates within the windows) and the sector has to be rebuilt
+    def update(self, rows: pd.DataFrame) -> bool:
+        rows = rows[["symbol", "date", "close"]].astype({"symbol": str})
+        if not self.columns.keys() >= set(rows.symbol) or (rows.date <= self.end).any():
+            return False
+        for symbol, date, close in rows.itertuples(index=False):
+            column = self.columns[symbol]
+            row = self.pending.setdefault(date, np.full(len(self.columns), np.nan))
+            row[column] = close
+            self.last_dates[column] = max(self.last_dates[column], date.to_datetime64())
+        end = self.last_dates.min()
+        if ready := sorted(date for date in self.pending if date <= end):
+            closes = np.array([self.pending.pop(date) for date in ready])
+            for engine in self.windows.values():
+                engine.extend(pd.DatetimeIndex(ready), closes)
+            self.end = ready[-1]
+            self.tables = {}
+        return True
+
+    # Correlation matrix and latest prices over the window of `days`
+    def table(self, days: int) -> tuple[pd.DataFrame, pd.Series]:
+        if days not in self.tables:
+            engine = self.windows[days]
+            self.tables[days] = (
+                pd.DataFrame(
+                    engine.correlation(), index=self.symbols, columns=self.symbols
+                ).round(3),
+                pd.Series(engine.last(), index=self.symbols, name="close").round(2),
+            )
+        return self.tables[days]
+
+
+# Rolling correlations of every sector, from a single pivot of the universe
+def sector_correlations(main_table: pd.DataFrame) -> dict[str, SectorCorrelations]:
+    dates, symbols, matrix = close_matrix(main_table)
+    sectors = (
+        main_table[["symbol", "sector"]]
+        .drop_duplicates("symbol")
+        .set_index("symbol")
+        .sector.astype(str)
+        .reindex(symbols)
+    )
+    return {
+        sector: SectorCorrelations(dates, symbols[columns], matrix[:, columns])
+        for sector, columns in pd.Series(np.arange(len(symbols))).groupby(
+            sectors.to_numpy()
+        )
+    }
+
+
+# Apply rows appended to main_table, rebuilding only the sectors they cannot be appended to
+def update_sector_correlations(
+    sectors: dict[str, SectorCorrelations],
+    new_rows: pd.DataFrame,
+    main_table: pd.DataFrame,
+) -> None:
+    for sector, rows in new_rows.groupby(new_rows.sector.astype(str)):
+        if sector in sectors and sectors[sector].update(rows):
+            continue
+        logger.debug("Rebuilding {} correlations", sector)
+        sector_rows = main_table.loc[main_table.sector == sector]
+        sector_rows = sector_rows.assign(
+            symbol=sector_rows.symbol.cat.remove_unused_categories()
+        )
+        sectors[sector] = SectorCorrelations(*close_matrix(sector_rows))
+
+
+# {database path: (database id, last loaded rowid, {sector: SectorCorrelations})}
+_memo: dict[str, tuple[str, int, dict[str, SectorCorrelations]]] = {}
+_memo_lock = threading.Lock()
+
+
+# Sector correlations of the main_table loaded by `data`, updated with the rows appended
+# by incremental loads, or computed (or fetched from `shared`) after full loads
+def get_sector_correlations(
+    data, shared: Any | None = None
+) -> dict[str, SectorCorrelations]:
+    path = str(data.db_path)
+    with data.load_lock:
+        database_id, version, rowid, appended, main_table = (
+            data.database_id,
+            data.data_version,
+            data.last_rowid,
+            data.appended_rows,
+            data.main_table,
+        )
+    memo = _memo.get(path)
+    # Correlations of a database rebuilt or replaced under the same path are dropped
+    if memo is not None and memo[0] != database_id:
+        memo = None
+    if memo is not None and memo[1] == rowid:
+        return memo[2]
+    key = f"sector_correlations:{path}:{database_id}:{version}:{rowid}"
+    sectors = shared.get(key) if shared is not None else None
+    if sectors is None:
+        if memo is not None and appended is not None and appended[0] == memo[1]:
+            sectors = memo[2]
+            update_sector_correlations(sectors, appended[1], main_table)
+        else:
+            logger.debug("Computing sector correlations (rowid {})", rowid)
+            sectors = sector_correlations(main_table)
+        if shared is not None:
+            # Older versions are never requested again, let them expire
+            shared.set(key, sectors, expire=7 * 24 * 3600)
+    _memo[path] = (database_id, rowid, sectors)
+    return sectors
+
+
+# Correlations over the last `days` and latest prices of a sector's tickers
+def sector_table(
+    data, sector: str, days: int = CORRELATION_DAYS, shared: Any | None = None
+) -> tuple[pd.DataFrame, pd.Series]:
+    # Correlations are updated in place, so reads are serialized with updates
+    with _memo_lock:
+        return get_sector_correlations(data, shared)[sector].table(days)
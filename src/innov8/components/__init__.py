@@ -1,10 +1,15 @@
 from innov8.components.charts_52w import carousel_52_week
 from innov8.components.dropdowns import dropdown_1, dropdown_2
-from innov8.components.forcast import forecast_button
+from innov8.components.forcast import forecast_button, forecast_stores
 from innov8.components.initial_load import initial_load
 from innov8.components.intra_sector import table_info
 from innov8.components.main_carousel import carousel
 from innov8.components.price_card import price_card
-from innov8.components.price_chart import ema_switch, price_chart, sma_switch
+from innov8.components.price_chart import (
+    ema_switch,
+    price_chart,
+    price_chart_columns,
+    sma_switch,
+)
 from innov8.components.themes import theme_changer
 from innov8.components.update import update_button, update_state
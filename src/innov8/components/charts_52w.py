@@ -1,5 +1,7 @@
+from functools import lru_cache
+
 import plotly.graph_objects as go
-from dash import dcc, html
+from dash import Patch, callback_context, dcc, html
 from dash.dependencies import Input, Output, State
 from dash_bootstrap_templates import ThemeChangerAIO, template_from_url
 
@@ -29,40 +31,12 @@ def carousel_52_week() -> html.Div:
     )
 
 
-# This function is responsible for updating the weekly price chart and the gauge (speedometer) chart
-@callback(
-    Output("52-week-price-chart", "figure"),
-    Output("52-week-high-low-indicator", "figure"),
-    Output("weekly-charts-container", "hidden"),
-    Input("symbol-dropdown", "value"),
-    Input(ThemeChangerAIO.ids.radio("theme"), "value"),
-    Input("update-state", "data"),
-)
-@data_access
-def update_52_week_charts(data, symbol, theme, _):
-    # Filter data by ticker symbol
-    ticker = data.main_table[data.main_table.symbol == symbol].set_index("date")
-
-    # The output from this resample operation feeds the weekly closing price chart
-    weekly_52 = (
-        ticker.resample(
-            "W-MON",
-            closed="left",
-            label="left",
-        )["close"]
-        .last()
-        .iloc[-52:]
-    )
-
+# Figures without data for a theme, filled in by update_52_week_charts
+@lru_cache(maxsize=32)
+def figure_skeletons(theme) -> tuple[dict, dict]:
     # Plot 52 week chart (price)
     fig = go.Figure()
-    fig.add_trace(
-        go.Scatter(
-            x=weekly_52.index,
-            y=weekly_52.values,
-            line_width=3,
-        )
-    )
+    fig.add_trace(go.Scatter(line_width=3))
     fig.update_layout(
         template=template_from_url(theme),  # set theme
         title={"text": "Weekly Chart", "y": 0.9},
@@ -77,19 +51,12 @@ def update_52_week_charts(data, symbol, theme, _):
     fig.update_xaxes(showticklabels=False, showgrid=False)
     fig.update_yaxes(showticklabels=False, showgrid=False)
 
-    # Get 52-week low/high and current price
-    df_52_week_low = ticker.close[-252:].min()
-    df_52_week_high = ticker.close[-252:].max()
-    current_price = ticker.iat[-1, ticker.columns.get_loc("close")]
-
     # Plot gauge (speedometer) chart which indicates the tickers current price compared to it's 52-week high/low
     fig2 = go.Figure()
     fig2.add_trace(
         go.Indicator(
-            value=current_price,
             mode="gauge",
             gauge={
-                "axis": {"range": [df_52_week_low, df_52_week_high]},
                 # Set bar color to theme's primary color (extracted from previous chart)
                 "bar": {"color": fig.layout.template.layout.colorway[0]},  # type: ignore
             },
@@ -100,7 +67,6 @@ def update_52_week_charts(data, symbol, theme, _):
     # Plot current price
     fig2.add_trace(
         go.Indicator(
-            value=current_price,
             mode="number",
             number={"valueformat": ".2f", "font_size": 27},
             domain={"x": [0.5, 0.5], "y": [0.35, 0.5]},
@@ -110,14 +76,8 @@ def update_52_week_charts(data, symbol, theme, _):
     # Plot colored percentage above the 52-week low
     fig2.add_trace(
         go.Indicator(
-            value=current_price,
             mode="delta",
-            delta={
-                "reference": df_52_week_low,
-                "relative": True,
-                "valueformat": ".2%",
-                "font_size": 13,
-            },
+            delta={"relative": True, "valueformat": ".2%", "font_size": 13},
             title={"text": "Above Low", "font_size": 13},
             domain={"x": [0.27, 0.37], "y": [0, 0.35]},
         )
@@ -126,14 +86,8 @@ def update_52_week_charts(data, symbol, theme, _):
     # Plot colored percentage below the 52-week high
     fig2.add_trace(
         go.Indicator(
-            value=current_price,
             mode="delta",
-            delta={
-                "reference": df_52_week_high,
-                "relative": True,
-                "valueformat": ".2%",
-                "font_size": 13,
-            },
+            delta={"relative": True, "valueformat": ".2%", "font_size": 13},
             title={"text": "Below High", "font_size": 13},
             domain={"x": [0.63, 0.73], "y": [0, 0.35]},
         )
@@ -151,7 +105,88 @@ def update_52_week_charts(data, symbol, theme, _):
         showlegend=False,
     )
 
-    return (fig, fig2, False)
+    return fig.to_dict(), fig2.to_dict()
+
+
+# Weekly closes and trace updates of a symbol, given its rows
+def weekly_traces(rows) -> tuple[list[dict], list[dict]]:
+    ticker = rows.set_index("date")
+
+    # The output from this resample operation feeds the weekly closing price chart
+    weekly_52 = (
+        ticker.resample(
+            "W-MON",
+            closed="left",
+            label="left",
+        )["close"]
+        .last()
+        .iloc[-52:]
+    )
+
+    # Get 52-week low/high and current price
+    df_52_week_low = ticker.close[-252:].min()
+    df_52_week_high = ticker.close[-252:].max()
+    current_price = ticker.close.iat[-1]
+
+    # Data of each trace of the two figures
+    return [{"x": weekly_52.index, "y": weekly_52.values}], [
+        {
+            "value": current_price,
+            "gauge": {"axis": {"range": [df_52_week_low, df_52_week_high]}},
+        },
+        {"value": current_price},
+        {"value": current_price, "delta": {"reference": df_52_week_low}},
+        {"value": current_price, "delta": {"reference": df_52_week_high}},
+    ]
+
+
+# Copy of `figure` with the nested properties of `updates` set
+def fill(figure: dict, updates: dict) -> dict:
+    return figure | {
+        key: fill(figure.get(key, {}), value) if isinstance(value, dict) else value
+        for key, value in updates.items()
+    }
+
+
+# Patch setting the nested properties of `updates`
+def patch(updates: dict, patched: Patch | None = None) -> Patch:
+    patched = Patch() if patched is None else patched
+    for key, value in updates.items():
+        if isinstance(value, dict):
+            patch(value, patched[key])
+        else:
+            patched[key] = value
+    return patched
+
+
+# This function is responsible for updating the weekly price chart and the gauge (speedometer) chart
+@callback(
+    Output("52-week-price-chart", "figure"),
+    Output("52-week-high-low-indicator", "figure"),
+    Output("weekly-charts-container", "hidden"),
+    Input("symbol-dropdown", "value"),
+    Input(ThemeChangerAIO.ids.radio("theme"), "value"),
+    Input("update-state", "data"),
+)
+@data_access
+def update_52_week_charts(data, symbol, theme, _):
+    # Computed once per symbol of each loaded table
+    price_traces, gauge_traces = data.symbol_data("weekly", symbol, weekly_traces)
+    # Only the trace data changes with the symbol, the figures are already rendered
+    if callback_context.triggered_prop_ids == {
+        "symbol-dropdown.value": "symbol-dropdown"
+    }:
+        return (
+            patch({"data": dict(enumerate(price_traces))}),
+            patch({"data": dict(enumerate(gauge_traces))}),
+            False,
+        )
+    # Otherwise fill in the theme's figures
+    figures = [
+        figure | {"data": [fill(*trace) for trace in zip(figure["data"], traces)]}
+        for figure, traces in zip(figure_skeletons(theme), (price_traces, gauge_traces))
+    ]
+    return (*figures, False)
 
 
 clientside_callback(
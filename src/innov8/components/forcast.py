@@ -1,10 +1,20 @@
+import os
 from datetime import datetime, timezone
 from typing import Any
 
 import dash_bootstrap_components as dbc
-from dash import Input, Output, State, ctx, no_update
+import diskcache
+from dash import Input, Output, Patch, State, ctx, dcc, no_update
 
-from innov8.decorators.data_access import callback, data_access
+from innov8.app import cache
+from innov8.components.price_chart import COLUMNAR
+from innov8.decorators.data_access import callback, clientside_callback, data_access
+from innov8.forecasting import engine_name, load_engine
+from innov8.payload_cache import PayloadCache
+
+# Compute the forecasts of symbols without (up to date) stored forecasts when requested,
+# in a background callback, instead of disabling the forecast button
+ON_DEMAND = os.getenv("ON_DEMAND_FORECASTS", "").lower() in ("1", "true", "yes")
 
 
 def forecast_button() -> dbc.Button:
@@ -17,13 +27,132 @@ def forecast_button() -> dbc.Button:
     )
 
 
-# Add forecast ohlc to main chart on button press
+# Symbols whose forecasts are requested and whose forecasts were computed on demand,
+# and the time of the last bar of the price chart (see LAST_BAR_TIME)
+def forecast_stores() -> list[dcc.Store]:
+    return [
+        dcc.Store(id="forecast-request"),
+        dcc.Store(id="forecast-ready"),
+        dcc.Store(id="price-chart-last-time"),
+    ]
+
+
+# Stored forecast bars of each symbol and whether they were generated from its current
+# history, for the loaded data version
+forecast_cache = PayloadCache("forecasts", maxsize=1024)
+
+
+# Candles of a symbol's forecasts (open, high, low, close, date rows) in the chart's time
+# format, as (date, candle) pairs
+def forecast_bars(forecasts: list[tuple]) -> list[tuple[float, dict]]:
+    return [
+        (
+            date,
+            {
+                "open": open_,
+                "high": high,
+                "low": low,
+                "close": close,
+                # Same time format as the other candles of the series
+                "time": (
+                    int(date)
+                    if COLUMNAR
+                    else datetime.fromtimestamp(date, tz=timezone.utc)
+                ),
+            },
+        )
+        for open_, high, low, close, date in forecasts
+    ]
+
+
+# Key of the forecasts computed on demand from a symbol's current history
+def on_demand_key(data, symbol) -> str:
+    fingerprint = data.history_fingerprint(engine_name(), data.get_symbol_frame(symbol))
+    return f"forecast:{data.db_path}:{symbol}:{fingerprint}"
+
+
+# Forecasts (open, high, low, close, date rows) of a symbol's current history, computed
+# once and kept in `shared` for every process, concurrent requests wait for the first one
+# Failed computations (no rows) are not kept, so that the next request retries them
+def forecast_on_demand(data, symbol, shared) -> list[tuple]:
+    key = on_demand_key(data, symbol)
+    if (forecasts := shared.get(key)) is not None:
+        return forecasts
+    with diskcache.Lock(shared, f"{key}:lock", expire=600):
+        if (forecasts := shared.get(key)) is None:
+            history = data.get_symbol_frame(symbol)[
+                ["date", "open", "high", "low", "close"]
+            ]
+            rows = dict(load_engine(engine_name()).forecast_many({symbol: history}))
+            forecasts = [(*row[1:], row[0]) for row in rows.get(symbol, [])]
+            if forecasts:
+                # Histories of later data versions have other keys, let this one expire
+                shared.set(key, forecasts, expire=7 * 24 * 3600)
+    return forecasts
+
+
+# Stored forecast bars of a symbol and whether they are up to date with its history
+def stored_forecast_bars(data, symbol) -> tuple[list[tuple[float, dict]], bool]:
+    return (
+        forecast_bars(data.get_symbol_forecasts(symbol)),
+        data.has_current_forecasts(symbol),
+    )
+
+
+# Forecast bars of a symbol as (date, candle) pairs, from the stored forecasts or, when
+# they are missing or stale, those computed on demand
+def symbol_forecast_bars(data, symbol) -> list[tuple[float, dict]]:
+    bars, current = forecast_cache.get(
+        symbol,
+        (str(data.db_path), data.database_id, data.data_version),
+        lambda: stored_forecast_bars(data, symbol),
+    )
+    if ON_DEMAND and not (bars and current):
+        bars = forecast_bars(cache.get(on_demand_key(data, symbol), []))
+    return bars
+
+
+# Time of the last candle of the price chart, in epoch seconds, kept in the browser so
+# that forecast requests only send it instead of the series
+# Candles are daily: ISO date strings are parsed as UTC, and so are the business day
+# objects ({year, month, day}) the chart converts string times to in place
+LAST_BAR_TIME = """
+function (seriesData) {
+    const candles = seriesData && seriesData[0];
+    if (!candles || !candles.length) {
+        return null;
+    }
+    const time = candles[candles.length - 1].time;
+    if (typeof time === "number") {
+        return time;
+    }
+    if (typeof time === "object") {
+        return Date.UTC(time.year, time.month - 1, time.day) / 1000;
+    }
+    return Date.parse(time.slice(0, 10)) / 1000;
+}
+"""
+
+clientside_callback(
+    LAST_BAR_TIME,
+    Output("price-chart-last-time", "data"),
+    Input("tv-price-chart", "seriesData"),
+)
+
+
+# Add forecast ohlc to main chart on button press, one bar per press
+# Only the time of the chart's last candle is sent, the first forecast bar after it is
+# appended to the price series with a Patch
 @callback(
     Input("forecast-button", "n_clicks"),
-    Input("tv-price-chart", "seriesData"),
+    # Updates of the price chart remove the forecast bars
+    Input("price-chart-container", "className"),
+    Input("forecast-ready", "data"),
     State("symbol-dropdown", "value"),
+    State("price-chart-last-time", "data"),
     output={
         "series_data": Output("tv-price-chart", "seriesData", allow_duplicate=True),
+        "forecast_request": Output("forecast-request", "data"),
         "forecast_button_disabled": Output("forecast-button", "disabled"),
         "forecast_button_clicks": Output("forecast-button", "n_clicks"),
         "forecast_button_color": Output("forecast-button", "color"),
@@ -32,17 +161,24 @@ def forecast_button() -> dbc.Button:
     prevent_initial_call=True,
 )
 @data_access
-def update_price_chart_w_forecast(data, button, series_data, symbol) -> Any:
+def update_price_chart_w_forecast(data, button, _, ready, symbol, last_time) -> Any:
     output = {
         "series_data": no_update,
+        "forecast_request": no_update,
         "forecast_button_disabled": False,
         "forecast_button_clicks": no_update,
         "forecast_button_color": "success",
         "forecast_button_style": {},
     }
 
+    # Forecasts computed on demand count as the first press
+    if ctx.triggered_id == "forecast-ready":
+        if ready != symbol:
+            return output | {"forecast_button_clicks": None}
+        button = 1
+        output["forecast_button_clicks"] = 1
     # Reset the button
-    if ctx.triggered_id != "forecast-button":
+    elif ctx.triggered_id != "forecast-button":
         return output | {"forecast_button_clicks": None}
 
     # Change the button color and style depending on how many times the forecast button has been pressed
@@ -60,32 +196,43 @@ def update_price_chart_w_forecast(data, button, series_data, symbol) -> Any:
                 "filter": "hue-rotate(-7deg) contrast(1.05) brightness(0.75)"
             }
 
-    date = series_data[0][-1]["time"]
-
-    date_obj = datetime(
-        day=date["day"], month=date["month"], year=date["year"], tzinfo=timezone.utc
-    )
-
-    forecast = data.get_forecasts(symbol, date_obj.timestamp())
-
-    if forecast:
-        series_data[0].append(
-            {
-                "open": forecast[0],
-                "high": forecast[1],
-                "low": forecast[2],
-                "close": forecast[3],
-                "time": datetime.fromtimestamp(forecast[4], tz=timezone.utc),
-            }
-        )
-
-        nxt = data.get_forecasts(symbol, forecast[4])
+    # Workers may have loaded another data version than the one the chart was drawn from,
+    # so bars follow the chart's last candle rather than the loaded data
+    if last_time is None:
+        last_time = data.get_symbol_frame(symbol).date.iat[-1].timestamp()
+    bars = [bar for date, bar in symbol_forecast_bars(data, symbol) if date > last_time]
 
+    if bars:
+        series_data = Patch()
+        series_data[0].append(bars[0])
         return output | {
             "series_data": series_data,
-            "forecast_button_disabled": nxt is None,
+            "forecast_button_disabled": len(bars) == 1,
+        }
+
+    # Compute the missing forecasts in the background (see generate_forecast_on_demand)
+    if not bars and ON_DEMAND and ctx.triggered_id == "forecast-button":
+        return output | {
+            "forecast_request": symbol,
+            "forecast_button_disabled": True,
+            "forecast_button_clicks": None,
         }
 
     return output | {
         "forecast_button_disabled": True,
     }
+
+
+if ON_DEMAND:
+
+    @callback(
+        Output("forecast-ready", "data"),
+        Input("forecast-request", "data"),
+        background=True,
+        running=[(Output("forecast-button", "children"), "Forecasting...", "Forecast")],
+        prevent_initial_call=True,
+    )
+    @data_access
+    def generate_forecast_on_demand(data, symbol) -> str:
+        forecast_on_demand(data, symbol, cache)
+        return symbol
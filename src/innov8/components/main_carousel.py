@@ -4,36 +4,6 @@ from dash.dependencies import Input, Output, State
 
 from innov8.decorators.data_access import callback, clientside_callback, data_access
 
-change_query = """
-WITH growth AS (
-    SELECT t.symbol,
-        d.date,
-        p.close
-    FROM price p
-        JOIN ticker t ON p.ticker_id = t.id
-        JOIN date d ON p.date_id = d.id
-)
-SELECT g1.symbol,
-    100 * (g1.close - g2.close) / g2.close AS growth_percentage
-FROM growth g1
-    JOIN (
-        SELECT symbol,
-            MAX(date) today
-        FROM growth
-        GROUP BY symbol
-    ) t ON g1.symbol = t.symbol
-    AND g1.date = t.today
-    JOIN growth g2 ON g1.symbol = g2.symbol
-    AND g2.date = (
-        SELECT MAX(date)
-        FROM growth
-        WHERE symbol = g1.symbol
-            AND date < g1.date
-    )
-ORDER BY ABS(growth_percentage) DESC
-LIMIT 10
-"""
-
 
 def carousel() -> html.Div:
     return html.Div(
@@ -69,7 +39,7 @@ def update_main_carousel(data, _) -> list[html.Div]:
             ],
             className="swiper-slide",
         )
-        for symbol, change in data.cur.execute(change_query)
+        for symbol, change in data.top_movers(10).change.items()
     ]
 
 
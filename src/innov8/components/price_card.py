@@ -40,9 +40,8 @@ def price_card():
 )
 @data_access
 def update_symbol_data(data, symbol, _):
-    ticker = data.main_table.loc[
-        data.main_table.symbol == symbol,
-        ["name", "close", "exchange", "sector", "currency"],
+    ticker = data.get_symbol_frame(symbol)[
+        ["name", "close", "exchange", "sector", "currency"]
     ].tail(2)
     # Getting the chosen symbols current price and its change in comparison to its previous value
     current_price = ticker.iat[-1, 1]
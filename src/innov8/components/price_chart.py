@@ -1,14 +1,18 @@
 import os
+from functools import lru_cache
 
 import dash_bootstrap_components as dbc
 import dash_tvlwc
 import plotly
-from dash import Patch, callback_context
+from dash import Patch, callback_context, dcc
 from dash.dependencies import Input, Output, State
 from dash.exceptions import PreventUpdate
 from dash_bootstrap_templates import ThemeChangerAIO, template_from_url
 
-from innov8.decorators.data_access import callback, data_access
+from innov8.app import cache
+from innov8.db_ops import DataStore
+from innov8.decorators.data_access import callback, clientside_callback, data_access
+from innov8.payload_cache import PayloadCache
 
 
 def hex_to_rgba(hex_color, alpha=1.0) -> str:
@@ -33,6 +37,11 @@ def price_chart() -> dash_tvlwc.Tvlwc:
     )
 
 
+# Holds the columnar series of the price chart (see COLUMNAR)
+def price_chart_columns() -> dcc.Store:
+    return dcc.Store(id="price-chart-columns")
+
+
 # EMA switch with selectable period
 def ema_switch() -> dbc.InputGroup:
     return dbc.InputGroup(
@@ -95,43 +104,127 @@ def sma_switch() -> dbc.InputGroup:
     )
 
 
-# Update price chart (with indicators)
+# Chart options (colors and watermark) matching a theme
+@lru_cache(maxsize=32)
+def chart_options(theme) -> dict:
+    template = plotly.io.templates[template_from_url(theme)]
+    text_color = template["layout"]["font"]["color"]  # type: ignore
+    # bg_color = template["layout"]["plot_bgcolor"]
+    grid_color = template["layout"]["scene"]["xaxis"]["gridcolor"]  # type: ignore
+    return {
+        "watermark": {
+            "visible": True,
+            "text": os.getenv("WATERMARK"),
+            "color": hex_to_rgba(text_color, 0.3),
+            "fontFamily": "Consolas, monospace, Roboto, Ubuntu, sans-serif, 'Trebuchet MS'",
+            "fontSize": 72,
+        },
+        "layout": {
+            # "textColor": "#ff80cc",
+            "textColor": text_color,
+            "background": {"type": "solid", "color": "rgba(0, 0, 0, 0)"},
+        },
+        "grid": {
+            "vertLines": {
+                "color": hex_to_rgba(grid_color, 0.3),
+            },
+            "horzLines": {
+                "color": hex_to_rgba(grid_color, 0.3),
+            },
+        },
+        "timeScale": {"borderColor": grid_color},
+    }
+
+
+# Update the chart's colors on theme change, without resending its series
 @callback(
-    Output("tv-price-chart", "seriesTypes"),
-    Output("tv-price-chart", "seriesData"),
-    Output("tv-price-chart", "seriesOptions"),
     Output("tv-price-chart", "chartOptions"),
-    Output("price-chart-container", "className"),
-    Input("symbol-dropdown", "value"),
-    Input("ema", "value"),
-    Input("sma", "value"),
-    State("ema-period", "value"),
-    State("sma-period", "value"),
     Input(ThemeChangerAIO.ids.radio("theme"), "value"),
-    Input("update-state", "data"),
 )
-@data_access
-def update_price_chart(data, symbol, ema, sma, ema_period, sma_period, theme, update):
+def update_price_chart_theme(theme) -> dict:
+    return chart_options(theme)
+
+
+# Send the price chart series in a columnar format, expanded in the browser (smaller
+# responses and faster JSON parsing with long histories)
+COLUMNAR = os.getenv("COLUMNAR_SERIES", "").lower() in ("1", "true", "yes")
+
+# Expands columnar series into the rows of each series expected by the chart
+EXPAND_SERIES = """
+    function expandSeries(columns) {
+        return columns.map((series) => {
+            const { start, up, palette, ...fields } = series;
+            // Series without times share those of the candles
+            if (!fields.time) {
+                fields.time = columns[0].time.slice(start || 0);
+            }
+            const names = Object.keys(fields);
+            return fields.time.map((_, i) => {
+                const row = {};
+                for (const name of names) {
+                    row[name] = fields[name][i];
+                }
+                if (up) {
+                    row.color = palette[up[i] ? 0 : 1];
+                }
+                return row;
+            });
+        });
+    }
+"""
+
+# Series of the price chart per (symbol, EMA period, SMA period), for the loaded data version
+series_cache = PayloadCache(
+    "price_chart_columns" if COLUMNAR else "price_chart", maxsize=128, shared=cache
+)
+
+
+# Series types, data and options of a symbol's price chart (None periods disable indicators)
+# With `columnar`, the data of each series is encoded as parallel arrays (see EXPAND_SERIES)
+def series_payload(
+    data: DataStore,
+    symbol: str,
+    ema_period: int | None,
+    sma_period: int | None,
+    columnar: bool = False,
+) -> tuple[list, list, list]:
     # Filter data by ticker symbol and rename for tvlwc
-    ticker = data.main_table.loc[
-        data.main_table.symbol == symbol,
-        ["open", "high", "low", "close", "volume", "date"],
+    ticker = data.get_symbol_frame(symbol)[
+        ["open", "high", "low", "close", "volume", "date"]
     ].rename(columns={"date": "time", "volume": "value"})
 
-    # Add color for plotting
-    ticker["color"] = hex_to_rgba(GREEN, OPACITY)
-    ticker["color"] = ticker.color.where(
-        ticker["close"] > ticker["open"], hex_to_rgba(RED, OPACITY)
-    ).astype("category")
     # Each indicator will have its own color in the chart
     colors = {"SMA": "#1c90d4", "EMA": "#ad0026"}
 
     # Plot candlesticks (price) and bar chart (volume)
     seriesTypes = ["candlestick", "histogram"]
-    seriesData = [
-        ticker[["open", "high", "low", "close", "time"]].to_dict("records"),
-        ticker[["value", "color", "time"]].to_dict("records"),
-    ]
+    if columnar:
+        # Parallel arrays with integer epoch times, and an up/down flag indexing the
+        # palette instead of a color string per volume bar
+        seriesData = [
+            {
+                "time": (ticker["time"].astype("int64") // 10**9).tolist(),
+                "open": ticker["open"].tolist(),
+                "high": ticker["high"].tolist(),
+                "low": ticker["low"].tolist(),
+                "close": ticker["close"].tolist(),
+            },
+            {
+                "value": ticker["value"].tolist(),
+                "up": (ticker["close"] > ticker["open"]).astype(int).tolist(),
+                "palette": [hex_to_rgba(GREEN, OPACITY), hex_to_rgba(RED, OPACITY)],
+            },
+        ]
+    else:
+        # Add color for plotting
+        ticker["color"] = hex_to_rgba(GREEN, OPACITY)
+        ticker["color"] = ticker.color.where(
+            ticker["close"] > ticker["open"], hex_to_rgba(RED, OPACITY)
+        ).astype("category")
+        seriesData = [
+            ticker[["open", "high", "low", "close", "time"]].to_dict("records"),
+            ticker[["value", "color", "time"]].to_dict("records"),
+        ]
     seriesOptions = [
         {
             "silent-title": "Price",
@@ -152,22 +245,23 @@ def update_price_chart(data, symbol, ema, sma, ema_period, sma_period, theme, up
         },
     ]
 
-    theme_name = template_from_url(theme)
-
-    template = plotly.io.templates[theme_name]
-    text_color = template["layout"]["font"]["color"]  # type: ignore
-    # bg_color = template["layout"]["plot_bgcolor"]
-    grid_color = template["layout"]["scene"]["xaxis"]["gridcolor"]  # type: ignore
-
     def plot_line(indicator) -> None:
         # Plot indicator line
         seriesTypes.append("line")
-        seriesData.append(
-            ticker[[indicator, "time"]]
-            .rename(columns={indicator: "value"})
-            .dropna()
-            .to_dict("records")
-        )
+        if columnar:
+            # Lines only lack leading values, their times are those of the candles
+            # from `start` on
+            line = ticker[indicator].dropna()
+            seriesData.append(
+                {"start": len(ticker) - len(line), "value": line.tolist()}
+            )
+        else:
+            seriesData.append(
+                ticker[[indicator, "time"]]
+                .rename(columns={indicator: "value"})
+                .dropna()
+                .to_dict("records")
+            )
         seriesOptions.append(
             {
                 "silent-title": indicator,
@@ -176,69 +270,113 @@ def update_price_chart(data, symbol, ema, sma, ema_period, sma_period, theme, up
             }
         )
 
-    # Empty list check
-    if ema:
+    if ema_period is not None:
         ticker["EMA"] = (
             ticker["close"]
             .ewm(span=ema_period, min_periods=ema_period, adjust=False)
             .mean()
         )
         plot_line("EMA")
-    if sma:
+    if sma_period is not None:
         ticker["SMA"] = ticker["close"].rolling(window=sma_period).mean()
         plot_line("SMA")
 
-    return (
-        seriesTypes,
-        seriesData,
-        seriesOptions,
-        {
-            "watermark": {
-                "visible": True,
-                "text": os.getenv("WATERMARK"),
-                "color": hex_to_rgba(text_color, 0.3),
-                "fontFamily": "Consolas, monospace, Roboto, Ubuntu, sans-serif, 'Trebuchet MS'",
-                "fontSize": 72,
-            },
-            "layout": {
-                # "textColor": "#ff80cc",
-                "textColor": text_color,
-                "background": {"type": "solid", "color": "rgba(0, 0, 0, 0)"},
-            },
-            "grid": {
-                "vertLines": {
-                    "color": hex_to_rgba(grid_color, 0.3),
-                },
-                "horzLines": {
-                    "color": hex_to_rgba(grid_color, 0.3),
-                },
-            },
-            "timeScale": {"borderColor": grid_color},
-        },
-        "visible",
-    )
+    return seriesTypes, seriesData, seriesOptions
 
 
-# Update indicators using partial property assignment
+# Update price chart (with indicators)
 @callback(
-    Output("tv-price-chart", "seriesData", allow_duplicate=True),
-    State("tv-price-chart", "seriesOptions"),
-    State("symbol-dropdown", "value"),
-    State("ema", "value"),
-    State("sma", "value"),
-    Input("ema-period", "value"),
-    Input("sma-period", "value"),
-    prevent_initial_call=True,
+    Output("tv-price-chart", "seriesTypes"),
+    # Columnar series are expanded into the chart's seriesData by EXPAND_SERIES
+    (
+        Output("price-chart-columns", "data")
+        if COLUMNAR
+        else Output("tv-price-chart", "seriesData")
+    ),
+    Output("tv-price-chart", "seriesOptions"),
+    Output("price-chart-container", "className"),
+    Input("symbol-dropdown", "value"),
+    Input("ema", "value"),
+    Input("sma", "value"),
+    State("ema-period", "value"),
+    State("sma-period", "value"),
+    Input("update-state", "data"),
 )
 @data_access
+def update_price_chart(data, symbol, ema, sma, ema_period, sma_period, update):
+    # Empty list check
+    ema_period = ema_period if ema else None
+    sma_period = sma_period if sma else None
+    seriesTypes, seriesData, seriesOptions = series_cache.get(
+        (symbol, ema_period, sma_period),
+        # The database path and id tell apart versions of different databases, including
+        # one rebuilt at the same path (its versions restart from 0)
+        (str(data.db_path), data.database_id, data.data_version),
+        lambda: series_payload(data, symbol, ema_period, sma_period, COLUMNAR),
+    )
+    return seriesTypes, seriesData, seriesOptions, "visible"
+
+
+if COLUMNAR:
+    clientside_callback(
+        EXPAND_SERIES,
+        Output("tv-price-chart", "seriesData", allow_duplicate=True),
+        Input("price-chart-columns", "data"),
+        prevent_initial_call=True,
+    )
+
+
+# Recompute indicators in the browser from the closes of the candlestick series
+UPDATE_INDICATOR_LINES = """
+    function updateIndicatorLines(emaPeriod, smaPeriod, seriesData, seriesOptions, ema, sma) {
+        const triggered = dash_clientside.callback_context.triggered.map((t) => t.prop_id);
+        const valid = (period) => Number.isInteger(period) && period >= 1;
+        // Forecast candles appended to the price series have no volume bar
+        const candles = seriesData[0].slice(0, seriesData[1].length);
+        const lines = {};
+        // Same as pandas' ewm(span=period, min_periods=period, adjust=False).mean()
+        if (triggered.includes("ema-period.value") && ema && ema.length && valid(emaPeriod)) {
+            const alpha = 2 / (emaPeriod + 1);
+            let value;
+            lines.EMA = [];
+            candles.forEach((candle, i) => {
+                value = i === 0 ? candle.close : (1 - alpha) * value + alpha * candle.close;
+                if (i >= emaPeriod - 1) {
+                    lines.EMA.push({ value: value, time: candle.time });
+                }
+            });
+        }
+        // Same as pandas' rolling(window=period).mean()
+        if (triggered.includes("sma-period.value") && sma && sma.length && valid(smaPeriod)) {
+            let sum = 0;
+            lines.SMA = [];
+            candles.forEach((candle, i) => {
+                sum += candle.close - (i >= smaPeriod ? candles[i - smaPeriod].close : 0);
+                if (i >= smaPeriod - 1) {
+                    lines.SMA.push({ value: sum / smaPeriod, time: candle.time });
+                }
+            });
+        }
+        if (Object.keys(lines).length === 0) {
+            return dash_clientside.no_update;
+        }
+        return seriesData.map((data, i) => lines[seriesOptions[i]["silent-title"]] || data);
+    }
+"""
+
+# Recompute indicators on the server instead (e.g. to debug the clientside callback)
+SERVER_INDICATORS = os.getenv("SERVER_INDICATORS", "").lower() in ("1", "true", "yes")
+
+
+# Update indicators using partial property assignment (server-side fallback)
+@data_access
 def update_indicator_period(
     data, seriesOptions, symbol, ema, sma, ema_period, sma_period
 ) -> Patch:
     # Filter data by ticker symbol and rename for tvlwc
-    ticker = data.main_table.loc[
-        data.main_table.symbol == symbol,
-        ["close", "date"],
-    ].rename(columns={"date": "time"})
+    ticker = data.get_symbol_frame(symbol)[["close", "date"]].rename(
+        columns={"date": "time"}
+    )
 
     # If no indicator is selected - prevent update
     if not (ema or sma):
@@ -273,3 +411,28 @@ def update_indicator_period(
         )
 
     return patched_seriesData
+
+
+if SERVER_INDICATORS:
+    callback(
+        Output("tv-price-chart", "seriesData", allow_duplicate=True),
+        State("tv-price-chart", "seriesOptions"),
+        State("symbol-dropdown", "value"),
+        State("ema", "value"),
+        State("sma", "value"),
+        Input("ema-period", "value"),
+        Input("sma-period", "value"),
+        prevent_initial_call=True,
+    )(update_indicator_period)
+else:
+    clientside_callback(
+        UPDATE_INDICATOR_LINES,
+        Output("tv-price-chart", "seriesData", allow_duplicate=True),
+        Input("ema-period", "value"),
+        Input("sma-period", "value"),
+        State("tv-price-chart", "seriesData"),
+        State("tv-price-chart", "seriesOptions"),
+        State("ema", "value"),
+        State("sma", "value"),
+        prevent_initial_call=True,
+    )
@@ -4,7 +4,6 @@ import dash_bootstrap_components as dbc
 from dash import dcc
 from dash.dependencies import Input, Output, State
 from loguru import logger
-from tqdm import tqdm
 
 from innov8 import update_all
 from innov8.decorators.data_access import callback, data_access
@@ -71,8 +70,7 @@ def update_ticker_data(
         up_to_date[symbol] = True
     elif scope == "Sector":
         logger.info("Updating sector {}...", sector)
-        for symbol in tqdm(sector_symbols):
-            data.add_new_ohlc(symbol)
+        data.update_ohlc(sector_symbols)
         up_to_date[sector] = True
     else:
         update_all.main()
@@ -1,28 +1,22 @@
-import numpy as np
-
-np.float_ = np.float64  # type: ignore
-
-import logging
+import hashlib
+import json
 import os
 import sqlite3
 import threading
-import time
-from datetime import datetime, timedelta
+from itertools import groupby, repeat
+from operator import itemgetter
 from pathlib import Path
-from typing import cast
+from typing import Any, Callable, Iterable, cast
 
+import numpy as np
 import pandas as pd
 import requests
 import yfinance as yf
 from bs4 import BeautifulSoup, Tag
 from loguru import logger
-from prophet import Prophet
-from tqdm import tqdm
 
-# Fit a model to trigger cmdstanpy before setting logging level
-Prophet().fit(pd.DataFrame({"ds": ["2022-01-01", "2022-01-02"], "y": [0, 1]}))
-# Suppress logging from cmdstanpy
-logging.getLogger("cmdstanpy").setLevel(logging.WARNING)
+from innov8.forecasting import engine_name, load_engine
+from innov8.ingest import OHLC_CHUNK_SIZE, YahooProvider, ingest
 
 
 # Define class for data storage operations
@@ -53,14 +47,46 @@ class DataStore:
         self.script_directory = script_directory
         # Construct the absolute path to the database file
         self.db_path = script_directory / "stonks.db"
+        # Columnar copy of main_table written by the updater (see write_snapshot)
+        self.snapshot_path = script_directory / "stonks.arrow"
+        # The single writer connection is guarded by `lock`, reads go through per-thread
+        # read-only connections (see read_con) and never wait for it
         self.lock = threading.Lock()
+        self.readers = threading.local()
+        # Serializes loads of main_table
+        self.load_lock = threading.Lock()
         # Connect to the database using the absolute path
         with self.lock:
-            self.con = sqlite3.connect(self.db_path, check_same_thread=False)
+            self.con = self.connect()
             self.cur = self.con.cursor()
 
         self.ticker_symbols = None
         self.main_table: pd.DataFrame | None = None
+        # Row offsets of each symbol's contiguous block within main_table
+        self.symbol_index: dict[str, slice] = {}
+        # The table, its index and the data derived from its symbols (see symbol_data)
+        self._indexed_table = (pd.DataFrame(), self.symbol_index, {})
+        # Latest daily bar of each symbol against its previous close (see set_main_table)
+        self.daily_change = pd.DataFrame()
+        # Largest price rowid loaded into main_table
+        self.last_rowid = 0
+        # Rows merged by the last incremental load with the rowid they follow
+        # (None after a full load), lets derived data be updated instead of recomputed
+        self.appended_rows: tuple[int, pd.DataFrame] | None = None
+        # Version of the database data main_table was loaded at (see read_data_version)
+        self.data_version = -1
+        # Random id of the database, generated when its tables are created, which tells
+        # apart databases rebuilt or replaced under the same path (see create_version_table)
+        self.database_id = ""
+        # In-memory copies of the date (unix timestamp -> id) and ticker (symbol -> id)
+        # dimensions, so that price rows are inserted with plain integer ids
+        self.date_ids: dict[int, int] = {}
+        self.ticker_ids: dict[str, int] = {}
+        # Forecasts of each symbol as (dates, open/high/low/close rows) arrays sorted by
+        # date, loaded with main_table so that requests never query the forecast table
+        self.forecasts: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+        # Fingerprints of the histories the stored forecasts were generated from
+        self.forecast_fingerprints: dict[str, str] = {}
 
         # Check if the database is populated by checking if the price table is present
         with self.lock:
@@ -81,15 +107,36 @@ class DataStore:
             # Download data and fill date and price tables
             self.fill_ohlc()
             self.load_main_table()
-            assert self.main_table is not None
-            for symbol in tqdm(self.main_table.symbol.unique()):
-                self.generate_forecast(symbol)
+            logger.info("Training models and generating forecasts...")
+            self.generate_forecasts(self.symbol_index, jobs=os.cpu_count() or 1)
         # If the database is already populated
         else:
             self.initiate_tickers_obj(scrape=False)
+            self.load_ids()
+            # Databases created before data versioning and forecast fingerprints
+            self.create_version_table()
+            self.create_forecast_tables()
 
         self.load_main_table()
 
+    # Open the writer connection, switching the database to write-ahead logging,
+    # so that readers see the last committed data while a transaction is in progress
+    def connect(self) -> sqlite3.Connection:
+        con = sqlite3.connect(self.db_path, check_same_thread=False)
+        con.execute("PRAGMA journal_mode=WAL")
+        # Durable enough with WAL (a power loss may only roll back the last transactions)
+        con.execute("PRAGMA synchronous=NORMAL")
+        return con
+
+    # Read-only connection of the calling thread (opened on first use)
+    @property
+    def read_con(self) -> sqlite3.Connection:
+        if (con := getattr(self.readers, "con", None)) is None:
+            con = self.readers.con = sqlite3.connect(
+                f"{self.db_path.as_uri()}?mode=ro", uri=True
+            )
+        return con
+
     # Define function to scrape ticker symbols of S&P500 stocks
     @staticmethod
     def scrape_symbols():
@@ -188,261 +235,481 @@ class DataStore:
         DROP TABLE IF EXISTS sector;
         DROP TABLE IF EXISTS currency;
         DROP TABLE IF EXISTS forecast;
+        DROP TABLE IF EXISTS data_version;
+        DROP TABLE IF EXISTS forecast_fingerprint;
+        DROP TABLE IF EXISTS forecast_params;
         """
         with self.lock:
             self.cur.executescript(drop_tables)
             self.cur.executescript(create_tables_query)
             self.con.commit()
+            self.date_ids, self.ticker_ids = {}, {}
+        # A snapshot of the previous tables would pass for an older version of the new ones
+        self.snapshot_path.unlink(missing_ok=True)
+        self.create_version_table()
+        self.create_forecast_tables()
+
+    # The data version is a single counter incremented by every write transaction,
+    # so that every process can cheaply tell whether the data changed since it last looked
+    # Versions restart from 0 when the tables are recreated, so the row also holds a random
+    # database id, which caches and snapshots derived from the data are tagged with
+    def create_version_table(self) -> None:
+        with self.lock:
+            with self.con:
+                self.con.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS data_version (
+                        id INTEGER PRIMARY KEY NOT NULL CHECK (id = 1),
+                        version INTEGER NOT NULL,
+                        database_id TEXT
+                    )
+                    """
+                )
+                # Version tables created before database ids
+                columns = [
+                    row[1]
+                    for row in self.con.execute("PRAGMA table_info(data_version)")
+                ]
+                if "database_id" not in columns:
+                    self.con.execute(
+                        "ALTER TABLE data_version ADD COLUMN database_id TEXT"
+                    )
+                self.con.execute(
+                    """
+                    INSERT
+                        OR IGNORE INTO data_version (id, version)
+                    VALUES (1, 0)
+                    """
+                )
+                self.con.execute(
+                    """
+                    UPDATE data_version
+                    SET database_id = lower(hex(randomblob(8)))
+                    WHERE database_id IS NULL
+                    """
+                )
 
-    def insert_ticker_info(self):
+    # Fingerprint of the history each symbol's forecasts were generated from (see
+    # generate_forecasts), so that symbols whose history did not change are not refitted,
+    # and the fitted model parameters (JSON) of each symbol and price type, from which
+    # engines that support it warm-start the next fit
+    def create_forecast_tables(self) -> None:
+        with self.lock:
+            with self.con:
+                self.con.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS forecast_fingerprint (
+                        ticker_id INTEGER PRIMARY KEY NOT NULL,
+                        fingerprint TEXT NOT NULL,
+                        FOREIGN KEY(ticker_id) REFERENCES ticker(id)
+                    )
+                    """
+                )
+                self.con.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS forecast_params (
+                        ticker_id INTEGER NOT NULL,
+                        price_type TEXT NOT NULL,
+                        params TEXT NOT NULL,
+                        PRIMARY KEY(ticker_id, price_type),
+                        FOREIGN KEY(ticker_id) REFERENCES ticker(id)
+                    )
+                    """
+                )
+
+    # Increment the data version, called within write transactions (holding the lock)
+    def bump_data_version(self) -> None:
+        self.con.execute("UPDATE data_version SET version = version + 1")
+
+    def read_data_version(self) -> int:
+        return self.read_con.execute("SELECT version FROM data_version").fetchone()[0]
+
+    def read_database_id(self) -> str:
+        return self.read_con.execute("SELECT database_id FROM data_version").fetchone()[
+            0
+        ]
+
+    # Number of price rows up to `rowid`, which only changes if rows were removed
+    def count_prices(self, rowid: int) -> int:
+        return self.read_con.execute(
+            "SELECT COUNT(*) FROM price WHERE rowid <= ?", (rowid,)
+        ).fetchone()[0]
+
+    # Load the date and ticker ids into memory
+    def load_ids(self) -> None:
+        with self.lock:
+            self.date_ids = dict(self.con.execute("SELECT date, id FROM date"))
+            self.ticker_ids = dict(self.con.execute("SELECT symbol, id FROM ticker"))
+
+    def insert_ticker_info(self, **options):
         logger.info("Populating database with main ticker information...")
-        for symbol in tqdm(self.ticker_symbols):
-            try:
-                info = self.tickers.tickers[symbol].info
-                with self.lock:
-                    with self.con:
-                        self.con.execute(
-                            """
-                            INSERT
-                                OR IGNORE INTO currency (iso_code)
-                            VALUES (:currency)
-                            """,
-                            info,
-                        )
-                        self.con.execute(
-                            """
-                            INSERT
-                                OR IGNORE INTO exchange (name)
-                            VALUES (:exchange)
-                            """,
-                            info,
-                        )
-                        self.con.execute(
-                            """
-                            INSERT
-                                OR IGNORE INTO ticker_type (name)
-                            VALUES (:quoteType)
-                            """,
-                            info,
-                        )
-                        self.con.execute(
-                            """
-                            INSERT
-                                OR IGNORE INTO sector (name)
-                            VALUES (:sector)
-                            """,
-                            info,
+        # Fetch concurrently, writing from a single thread (see innov8.ingest.ingest for options)
+        ingest(self.ticker_symbols, self.provider.info, self.insert_info, **options)
+
+    # Insert the info of a ticker (as returned by yfinance) into the database
+    def insert_info(self, symbol: str, info: dict) -> None:
+        with self.lock:
+            with self.con:
+                self.con.execute(
+                    """
+                    INSERT
+                        OR IGNORE INTO currency (iso_code)
+                    VALUES (:currency)
+                    """,
+                    info,
+                )
+                self.con.execute(
+                    """
+                    INSERT
+                        OR IGNORE INTO exchange (name)
+                    VALUES (:exchange)
+                    """,
+                    info,
+                )
+                self.con.execute(
+                    """
+                    INSERT
+                        OR IGNORE INTO ticker_type (name)
+                    VALUES (:quoteType)
+                    """,
+                    info,
+                )
+                self.con.execute(
+                    """
+                    INSERT
+                        OR IGNORE INTO sector (name)
+                    VALUES (:sector)
+                    """,
+                    info,
+                )
+                ticker_id = self.con.execute(
+                    """
+                    INSERT INTO ticker (
+                            name,
+                            symbol,
+                            currency_id,
+                            exchange_id,
+                            ticker_type_id,
+                            sector_id
                         )
-                        self.con.execute(
-                            """
-                            INSERT INTO ticker (
-                                    name,
-                                    symbol,
-                                    currency_id,
-                                    exchange_id,
-                                    ticker_type_id,
-                                    sector_id
-                                )
-                            VALUES (
-                                    :shortName,
-                                    :symbol,
-                                    (
-                                        SELECT id
-                                        FROM currency
-                                        WHERE iso_code = :currency
-                                    ),
-                                    (
-                                        SELECT id
-                                        FROM exchange
-                                        WHERE name = :exchange
-                                    ),
-                                    (
-                                        SELECT id
-                                        FROM ticker_type
-                                        WHERE name = :quoteType
-                                    ),
-                                    (
-                                        SELECT id
-                                        FROM sector
-                                        WHERE name = :sector
-                                    )
-                                )
-                            """,
-                            info,
+                    VALUES (
+                            :shortName,
+                            :symbol,
+                            (
+                                SELECT id
+                                FROM currency
+                                WHERE iso_code = :currency
+                            ),
+                            (
+                                SELECT id
+                                FROM exchange
+                                WHERE name = :exchange
+                            ),
+                            (
+                                SELECT id
+                                FROM ticker_type
+                                WHERE name = :quoteType
+                            ),
+                            (
+                                SELECT id
+                                FROM sector
+                                WHERE name = :sector
+                            )
                         )
-                logger.debug("Successfully inserted info for {}", symbol)
-            except Exception:
-                logger.error("Failed to insert {}", symbol)
+                    """,
+                    info,
+                ).lastrowid
+                self.bump_data_version()
+            self.ticker_ids[symbol] = ticker_id
+        logger.debug("Successfully inserted info for {}", symbol)
 
-    def fill_ohlc(self):
+    def fill_ohlc(self, **options):
         logger.info("Populating database with OHLC data...")
-        # Per ticker OHLC data retrieval - helps avoid rate limiting
+        self.update_ohlc(**options)
+
+    # Download and insert new OHLC data for the given symbols (all symbols by default)
+    # Symbols needing data from the same start date are downloaded together in chunks
+    # of `chunk_size` (one by one if it is 1), see innov8.ingest.ingest for the other options
+    def update_ohlc(
+        self,
+        symbols: Iterable[str] | None = None,
+        chunk_size: int = OHLC_CHUNK_SIZE,
+        **options,
+    ) -> None:
+        # Get the date for the next entry of each symbol (None if no data is stored yet)
+        # Read through the writer connection, which sees its own uncommitted changes
         with self.lock:
-            symbols = self.cur.execute(
-                """
-                SELECT symbol
-                FROM ticker
-                """
-            ).fetchall()
-        for symbol in tqdm(symbols):
-            try:
-                # Retrieve OHLC data for symbol
-                start_date = (datetime.now() - timedelta(days=365)).strftime("%Y-%m-%d")
-                end_date = datetime.now().strftime("%Y-%m-%d")
-                ohlc_data = self.tickers.tickers[symbol[0]].history(
-                    start=start_date, end=end_date
-                )[["Open", "High", "Low", "Close", "Volume"]]
-                # Convert the date to a unix timestamp (remove timezone holding local time representations)
-                ohlc_data.index = (
-                    cast(pd.DatetimeIndex, ohlc_data.index)
-                    .tz_localize(None)
-                    .astype("int64")
-                    / 10**9
+            next_entries = dict(
+                self.con.execute(
+                    """
+                    SELECT t.symbol,
+                        DATE(max(d.date) + 86400, 'unixepoch')
+                    FROM ticker t
+                        LEFT JOIN price p ON t.id = p.ticker_id
+                        LEFT JOIN date d ON p.date_id = d.id
+                    GROUP BY t.symbol
+                    """
                 )
-                ohlc_data.reset_index(inplace=True)
-                # Convert to a list of dictionaries (records)
-                ohlc_data = ohlc_data.to_dict(orient="records")
-                with self.lock:
-                    with self.con:
-                        # Inserting date could be optimized
-                        self.con.executemany(
-                            """
-                            INSERT
-                                OR IGNORE INTO date (date)
-                            VALUES (:Date)
-                            """,
-                            ohlc_data,
-                        )
+            )
+        # Group the symbols by the date their data starts from
+        groups: dict[str | None, list[str]] = {}
+        for symbol in next_entries if symbols is None else symbols:
+            groups.setdefault(next_entries.get(symbol), []).append(symbol)
+        chunks = [
+            (start, tuple(group[i : i + chunk_size]))
+            for start, group in groups.items()
+            for i in range(0, len(group), max(chunk_size, 1))
+        ]
+
+        def fetch(chunk):
+            start, chunk_symbols = chunk
+            if len(chunk_symbols) == 1:
+                ohlc_data = self.provider.history(chunk_symbols[0], start)
+                return None if ohlc_data is None else {chunk_symbols[0]: ohlc_data}
+            return self.provider.download(list(chunk_symbols), start)
 
-                        # Using an f-string is an SQL injection vulnerability,
-                        # but given the context it doesn't matter, can be easily fixed if needed
-                        self.con.executemany(
-                            f"""
-                            INSERT INTO price (
-                                    ticker_id,
-                                    date_id,
-                                    OPEN,
-                                    high,
-                                    low,
-                                    close,
-                                    volume
-                                )
-                            VALUES (
-                                    (
-                                        SELECT id
-                                        FROM ticker
-                                        WHERE symbol = '{symbol[0]}'
-                                    ),
-                                    (
-                                        SELECT id
-                                        FROM date
-                                        WHERE date = :Date
-                                    ),
-                                    :Open,
-                                    :High,
-                                    :Low,
-                                    :Close,
-                                    :Volume
-                                )
+        stats = ingest(
+            chunks,
+            fetch,
+            lambda _, ohlc_data: self.insert_ohlc_many(ohlc_data),
+            **options,
+        )
+        logger.debug("OHLC update: {}", stats)
+
+    # Insert OHLC data (as returned by yfinance) of a symbol into the database
+    def insert_ohlc(self, symbol: str, ohlc_data: pd.DataFrame) -> None:
+        self.insert_ohlc_many({symbol: ohlc_data})
+
+    # Insert OHLC data of several symbols ({symbol: DataFrame}) in a single transaction
+    # Bars that are already stored are ignored, so that an overlapping download of one
+    # symbol does not roll back the bars of the others
+    def insert_ohlc_many(self, ohlc_data: dict[str, pd.DataFrame]) -> None:
+        # Convert the dates to unix timestamps (remove timezone holding local time representations)
+        timestamps = {
+            symbol: (
+                cast(pd.DatetimeIndex, frame.index).tz_localize(None).astype("int64")
+                // 10**9
+            ).tolist()
+            for symbol, frame in ohlc_data.items()
+        }
+        with self.lock:
+            # Tickers inserted by another process since the ids were loaded
+            if not self.ticker_ids.keys() >= ohlc_data.keys():
+                self.ticker_ids = dict(
+                    self.con.execute("SELECT symbol, id FROM ticker")
+                )
+            with self.con:
+                new_dates = {
+                    date
+                    for dates in timestamps.values()
+                    for date in dates
+                    if date not in self.date_ids
+                }
+                if new_dates:
+                    self.con.executemany(
+                        """
+                        INSERT
+                            OR IGNORE INTO date (date)
+                        VALUES (?)
                         """,
-                            ohlc_data,
+                        [(date,) for date in new_dates],
+                    )
+                    # Ids are never reassigned, so fetching every id from the earliest
+                    # new date onwards keeps the map correct
+                    self.date_ids.update(
+                        self.con.execute(
+                            "SELECT date, id FROM date WHERE date >= ?",
+                            (min(new_dates),),
                         )
-                logger.debug("Successfully inserted OHLC data for {}", symbol[0])
-            except Exception as e:
-                logger.error("[{}] Exception: {}", symbol[0], e)
+                    )
+                self.con.executemany(
+                    """
+                    INSERT
+                        OR IGNORE INTO price (
+                            ticker_id,
+                            date_id,
+                            OPEN,
+                            high,
+                            low,
+                            close,
+                            volume
+                        )
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    [
+                        row
+                        for symbol, frame in ohlc_data.items()
+                        for row in zip(
+                            repeat(self.ticker_ids[symbol]),
+                            map(self.date_ids.__getitem__, timestamps[symbol]),
+                            frame["Open"].tolist(),
+                            frame["High"].tolist(),
+                            frame["Low"].tolist(),
+                            frame["Close"].tolist(),
+                            frame["Volume"].tolist(),
+                        )
+                    ],
+                )
+                self.bump_data_version()
+        for symbol in ohlc_data:
+            logger.debug("{} updated \u2713", symbol)
 
     def generate_forecast(self, symbol: str) -> None:
-        with self.lock:
-            df = self.main_table
-        assert df is not None
-
-        predictions = {}
-        periods = 5
-        for price_type in ["open", "high", "low", "close"]:
-            # Prepare the dataframe for Prophet
-            df_prophet = df.loc[df["symbol"] == symbol, ["date", price_type]].rename(
-                columns={"date": "ds", price_type: "y"}
-            )
+        self.generate_forecasts([symbol])
 
-            # Initialize and fit the Prophet model
-            model = Prophet()
-            model.fit(df_prophet)
-
-            # Create a dataframe for future dates
-            future = model.make_future_dataframe(
-                periods=periods, freq="B"
-            )  # 'B' is for business days
-            forecast = model.predict(future)
-
-            # Get the last period values
-            last_period = df_prophet.diff().abs()["y"].tail(periods).to_numpy()
-            last_price = df_prophet.iat[-1, 1]
-            # Calculate the sum of the price differences (to be used in the margin)
-            s = last_period.sum()
-            # Resize the array to fit the predicted number of periods
-            price_diffs = np.resize(last_period, periods * 2)
-
-            forecasts = forecast[["ds", "yhat"]].tail(periods)
-            for i in range(periods):
-                # Calculate moving average
-                margin = s / periods
-                # Clip the price to be within the margin
-                price = forecasts.iat[i, 1].clip(
-                    last_price - margin, last_price + margin
-                )
-                # Add the new price difference
-                price_diffs[i + periods] = abs(price - last_price)
-                last_price = price
-                # Update the sum
-                s = s - price_diffs[i] + price_diffs[i + periods]
-                forecasts.iat[i, 1] = price
-            predictions[price_type] = forecasts
-
-        # Store relevant data in the database
-        for i in range(periods):
-            pred_date = predictions["open"].iloc[i]["ds"].tz_localize(None).timestamp()
-            o_price = predictions["open"].iloc[i]["yhat"]
-            c_price = predictions["close"].iloc[i]["yhat"]
-            h_price = max(
-                predictions["high"].iloc[i]["yhat"],
-                o_price,
-                c_price,
-                predictions["low"].iloc[i]["yhat"],
+    # Generate forecasts for the given symbols using `jobs` worker processes
+    # and store them in a single transaction
+    # The engine (see innov8.forecasting.ENGINES) defaults to the FORECAST_ENGINE environment variable
+    # Symbols whose history and engine match the fingerprint of their stored forecasts
+    # are skipped, unless `refit` is set. Returns the numbers of fitted and skipped symbols
+    # Fits start from the stored parameters of the previous fits (see create_forecast_tables)
+    def generate_forecasts(
+        self,
+        symbols: Iterable[str],
+        jobs: int = 1,
+        engine: str | None = None,
+        refit: bool = False,
+    ) -> dict[str, int]:
+        engine = engine_name(engine)
+
+        # Only the columns needed for fitting are shipped to the engine
+        histories = {
+            symbol: self.get_symbol_frame(symbol)[
+                ["date", "open", "high", "low", "close"]
+            ]
+            for symbol in symbols
+        }
+        fingerprints = {
+            symbol: self.history_fingerprint(engine, history)
+            for symbol, history in histories.items()
+        }
+        if not refit:
+            stored = self.read_fingerprints()
+            histories = {
+                symbol: history
+                for symbol, history in histories.items()
+                if stored.get(symbol) != fingerprints[symbol]
+            }
+        stats = {
+            "fitted": len(histories),
+            "skipped": len(fingerprints) - len(histories),
+        }
+        logger.info(
+            "Fitting {fitted} symbols, skipping {skipped} with unchanged history",
+            **stats,
+        )
+        if histories:
+            # Engines are imported here, so that only the paths generating forecasts pay for loading them
+            forecast_engine = load_engine(engine)
+            params = self.read_forecast_params(histories)
+            forecasts = dict(forecast_engine.forecast_many(histories, jobs, params))
+            self.store_forecasts(
+                forecasts,
+                {symbol: fingerprints[symbol] for symbol in forecasts},
+                {symbol: params[symbol] for symbol in forecasts if symbol in params},
             )
-            l_price = min(
-                predictions["low"].iloc[i]["yhat"],
-                o_price,
-                c_price,
-                predictions["high"].iloc[i]["yhat"],
+        return stats
+
+    # Identifies the input of a forecast: the engine, last date and number of rows of the
+    # history and a hash of its contents
+    @staticmethod
+    def history_fingerprint(engine: str, history: pd.DataFrame) -> str:
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(history["date"].to_numpy().astype("datetime64[ns]").tobytes())
+        digest.update(
+            np.ascontiguousarray(
+                history[["open", "high", "low", "close"]].to_numpy(dtype=float)
+            ).tobytes()
+        )
+        last_date = history["date"].iat[-1].strftime("%Y-%m-%d") if len(history) else ""
+        return f"{engine}:{last_date}:{len(history)}:{digest.hexdigest()}"
+
+    # Fingerprints of the stored forecasts by symbol
+    def read_fingerprints(self) -> dict[str, str]:
+        return dict(
+            self.read_con.execute(
+                """
+                SELECT t.symbol, f.fingerprint
+                FROM forecast_fingerprint f
+                    JOIN ticker t ON f.ticker_id = t.id
+                """
             )
+        )
 
-            # Insert data into the database
-            try:
-                with self.lock:
-                    with self.con:
-                        self.con.execute(
-                            """
-                            INSERT INTO forecast (ticker_id, date, open, high, low, close)
-                            VALUES (
-                                (
-                                    SELECT id
-                                    FROM ticker
-                                    WHERE symbol = ?
-                                ),
-                                ?, ?, ?, ?, ?
-                            )
-                            """,
-                            (
-                                symbol,
-                                pred_date,
-                                o_price,
-                                h_price,
-                                l_price,
-                                c_price,
-                            ),
-                        )
-            except Exception as e:
-                logger.error("[{}] Exception: {}", symbol, e)
+    # Fitted model parameters of the given symbols ({symbol: {price type: parameters}})
+    def read_forecast_params(
+        self, symbols: Iterable[str]
+    ) -> dict[str, dict[str, dict]]:
+        symbols = set(symbols)
+        params: dict[str, dict[str, dict]] = {}
+        for symbol, price_type, values in self.read_con.execute(
+            """
+            SELECT t.symbol, p.price_type, p.params
+            FROM forecast_params p
+                JOIN ticker t ON p.ticker_id = t.id
+            """
+        ):
+            if symbol in symbols:
+                params.setdefault(symbol, {})[price_type] = json.loads(values)
+        return params
+
+    # Store forecasts ({symbol: [(date, open, high, low, close), ...]}) in the database,
+    # along with the fingerprints of the histories they were generated from and the fitted
+    # model parameters (if given)
+    # The previous forecasts of these symbols are swapped for the new ones in a single
+    # transaction, so readers see either the old or the new forecasts, never neither
+    def store_forecasts(
+        self,
+        forecasts: dict[str, list[tuple[float, float, float, float, float]]],
+        fingerprints: dict[str, str] | None = None,
+        params: dict[str, dict[str, dict]] | None = None,
+    ) -> None:
+        with self.lock:
+            ticker_ids = self.ticker_ids
+            with self.con:
+                for table in ("forecast", "forecast_fingerprint"):
+                    self.con.executemany(
+                        f"""
+                        DELETE
+                        FROM {table}
+                        WHERE ticker_id = ?
+                        """,
+                        [(ticker_ids[symbol],) for symbol in forecasts],
+                    )
+                self.con.executemany(
+                    """
+                    INSERT INTO forecast (ticker_id, date, open, high, low, close)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    """,
+                    [
+                        (ticker_ids[symbol], *row)
+                        for symbol, rows in forecasts.items()
+                        for row in rows
+                    ],
+                )
+                self.con.executemany(
+                    """
+                    INSERT INTO forecast_fingerprint (ticker_id, fingerprint)
+                    VALUES (?, ?)
+                    """,
+                    [
+                        (ticker_ids[symbol], fingerprint)
+                        for symbol, fingerprint in (fingerprints or {}).items()
+                    ],
+                )
+                self.con.executemany(
+                    """
+                    INSERT
+                        OR REPLACE INTO forecast_params (ticker_id, price_type, params)
+                    VALUES (?, ?, ?)
+                    """,
+                    [
+                        (ticker_ids[symbol], price_type, json.dumps(values))
+                        for symbol, symbol_params in (params or {}).items()
+                        for price_type, values in symbol_params.items()
+                    ],
+                )
+                self.bump_data_version()
 
     def clear_forecasts(self):
         with self.lock:
@@ -453,168 +720,307 @@ class DataStore:
                     FROM forecast;
                     """
                 )
-
-    def get_forecasts(self, symbol: str, date: datetime):
-        with self.lock:
-            with self.con:
-                return self.con.execute(
+                self.con.execute(
                     """
-                    SELECT open, high, low, close, date
-                    FROM forecast
-                    WHERE ticker_id = (
-                        SELECT id
-                        FROM ticker
-                        WHERE symbol = ?
-                    )
-                    AND date > ?
-                    ORDER BY date ASC
-                    LIMIT 1
-                    """,
-                    (symbol, date),
-                ).fetchone()
+                    DELETE
+                    FROM forecast_fingerprint;
+                    """
+                )
+                self.bump_data_version()
+
+    # Read all forecasts and their fingerprints into self.forecasts and
+    # self.forecast_fingerprints
+    def load_forecasts(self) -> None:
+        rows = self.read_con.execute(
+            """
+            SELECT t.symbol, f.date, f.open, f.high, f.low, f.close
+            FROM forecast f
+                JOIN ticker t ON f.ticker_id = t.id
+            ORDER BY t.symbol, f.date
+            """
+        ).fetchall()
+        forecasts = {}
+        for symbol, symbol_rows in groupby(rows, key=itemgetter(0)):
+            array = np.array([row[1:] for row in symbol_rows], dtype=float)
+            forecasts[symbol] = (array[:, 0], array[:, 1:])
+        fingerprints = self.read_fingerprints()
+        # Swapped in at once, requests read either the previous or the new forecasts
+        self.forecasts = forecasts
+        self.forecast_fingerprints = fingerprints
+
+    # Whether the stored forecasts of a symbol were generated from its current history,
+    # by the engine they were generated with (the first field of the fingerprint)
+    def has_current_forecasts(self, symbol: str) -> bool:
+        if (fingerprint := self.forecast_fingerprints.get(symbol)) is None:
+            return False
+        engine = fingerprint.split(":", 1)[0]
+        return fingerprint == self.history_fingerprint(
+            engine, self.get_symbol_frame(symbol)
+        )
+
+    # The first forecast (open, high, low, close, date) of a symbol after `date`
+    def get_forecasts(self, symbol: str, date: float) -> tuple | None:
+        if (forecasts := self.forecasts.get(symbol)) is None:
+            return None
+        dates, ohlc = forecasts
+        i = dates.searchsorted(date, side="right")
+        if i == len(dates):
+            return None
+        return (*ohlc[i].tolist(), dates[i].item())
+
+    # All forecasts (open, high, low, close, date) of a symbol, by date
+    def get_symbol_forecasts(self, symbol: str) -> list[tuple]:
+        if (forecasts := self.forecasts.get(symbol)) is None:
+            return []
+        dates, ohlc = forecasts
+        return [(*row, date) for row, date in zip(ohlc.tolist(), dates.tolist())]
 
     # Create DataFrame from SQL query
-    def load_main_table(self, force_update=True):
+    # By default only price rows inserted since the last load are read and merged
+    # into the existing table, `full=True` re-reads the whole table
+    # With `force_update=False` the database is only read if its data version changed
+    # since the last load (e.g. after an update by another process)
+    # Forecasts are reloaded along with it
+    # The data version (and database id) are published last, so that requests keying
+    # caches on them never pair the new version with the previous table or forecasts
+    def load_main_table(self, force_update=True, full=False):
+        with self.load_lock:
+            version = self.read_data_version()
+            if version == self.data_version and not (force_update or full):
+                return
+            database_id = self.read_database_id()
+            # Start from the snapshot on the first load, only newer rows are then read below
+            if self.main_table is None and not full:
+                self.read_snapshot(version, database_id)
+            # Price rows are only ever appended, so the rowid marks what has been loaded
+            max_rowid = (
+                self.read_con.execute("SELECT MAX(rowid) FROM price").fetchone()[0] or 0
+            )
+            # Fall back to a full load if rows were removed since the last load
+            if full or self.main_table is None or max_rowid < self.last_rowid:
+                logger.info("Loading main table...")
+                main_table = self.read_prices(0, max_rowid)
+                self.appended_rows = None
+            elif max_rowid > self.last_rowid:
+                logger.info("Loading new rows into main table...")
+                new_rows = self.read_prices(self.last_rowid, max_rowid)
+                main_table = self.merge_rows(new_rows)
+                self.appended_rows = (self.last_rowid, new_rows)
+            else:
+                main_table = None
+            self.load_forecasts()
+            if main_table is not None:
+                self.last_rowid = max_rowid
+                self.set_main_table(main_table)
+            self.database_id = database_id
+            self.data_version = version
+
+    # Write main_table to a memory-mappable Arrow IPC file, tagged with its data version,
+    # the database id and its last price rowid along with the number of price rows up to it,
+    # so that other processes can start without querying the database
+    # Requires pyarrow (the `snapshot` extra), the snapshot is skipped without it
+    def write_snapshot(self) -> None:
+        try:
+            import pyarrow as pa
+        except ImportError:
+            logger.warning("pyarrow is not installed, skipping the main table snapshot")
+            return
+        with self.load_lock:
+            table = pa.Table.from_pandas(self.main_table, preserve_index=False)
+            table = table.replace_schema_metadata(
+                table.schema.metadata
+                | {
+                    b"data_version": str(self.data_version).encode(),
+                    b"database_id": self.database_id.encode(),
+                    b"last_rowid": str(self.last_rowid).encode(),
+                    b"price_rows": str(self.count_prices(self.last_rowid)).encode(),
+                }
+            )
+        # Replace the previous snapshot atomically, readers may have it open
+        temporary_path = self.snapshot_path.with_suffix(".tmp")
+        with pa.OSFile(str(temporary_path), "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(temporary_path, self.snapshot_path)
+        logger.info("Main table snapshot written (version {})", self.data_version)
+
+    # Load main_table from the snapshot if it was written from this database (`database_id`
+    # and price rows up to its last rowid) at a version not newer than `version`
+    # Returns whether the snapshot was loaded
+    def read_snapshot(self, version: int, database_id: str) -> bool:
+        try:
+            import pyarrow as pa
+        except ImportError:
+            return False
+        try:
+            with pa.memory_map(str(self.snapshot_path)) as source:
+                table = pa.ipc.open_file(source).read_all()
+        except (FileNotFoundError, pa.ArrowInvalid) as e:
+            logger.debug("No usable main table snapshot: {}", e)
+            return False
+        metadata = table.schema.metadata
+        last_rowid = int(metadata.get(b"last_rowid", -1))
         if (
-            (update_signal := os.path.exists(self.script_directory / "update_signal"))
-            or force_update
-            or self.main_table is None
+            metadata.get(b"database_id", b"").decode() != database_id
+            or int(metadata[b"data_version"]) > version
+            or int(metadata.get(b"price_rows", -1)) != self.count_prices(last_rowid)
         ):
-            logger.info("Loading main table...")
-            if update_signal:
-                with self.lock:
-                    if self.con:
-                        self.con.close()  # Close the existing connection if it exists
-
-                    self.con = sqlite3.connect(self.db_path, check_same_thread=False)
-                    self.cur = self.con.cursor()
-                    os.remove(self.script_directory / "update_signal")
-            with self.lock:
-                self.main_table = pd.read_sql_query(
-                    self.main_query,
-                    self.con,
-                    parse_dates=["date"],
-                    dtype={
-                        "symbol": "category",
-                        "name": "category",
-                        "sector": "category",
-                        "exchange": "category",
-                        "type": "category",
-                        "currency": "category",
-                    },
-                )
+            logger.debug("Main table snapshot does not match the database")
+            return False
+        logger.info("Loading main table from snapshot...")
+        self.last_rowid = last_rowid
+        # Numeric columns are handed over without copying, the snapshot is written from
+        # main_table, so it is already sorted
+        self.set_main_table(
+            table.to_pandas(split_blocks=True, self_destruct=True), is_sorted=True
+        )
+        return True
+
+    # Read the price rows within a rowid range (joined with ticker information)
+    def read_prices(self, after_rowid: int, max_rowid: int) -> pd.DataFrame:
+        return pd.read_sql_query(
+            self.main_query + "WHERE p.rowid > ? AND p.rowid <= ?",
+            self.read_con,
+            params=(after_rowid, max_rowid),
+            parse_dates=["date"],
+            dtype={
+                "symbol": "category",
+                "name": "category",
+                "sector": "category",
+                "exchange": "category",
+                "type": "category",
+                "currency": "category",
+            },
+        )
+
+    # Append new rows to main_table, replacing rows of the same symbol and date
+    def merge_rows(self, new_rows: pd.DataFrame) -> pd.DataFrame:
+        main_table = self.main_table
+        assert main_table is not None
+        # Extend the categories of main_table, so that concatenation keeps the categorical columns
+        categories = {}
+        for column in main_table.select_dtypes("category").columns:
+            current = main_table[column].cat.categories
+            categories[column] = current.append(
+                new_rows[column].cat.categories.difference(current)
+            )
+        main_table = main_table.astype(
+            {column: pd.CategoricalDtype(c) for column, c in categories.items()}
+        )
+        new_rows = new_rows.astype(
+            {column: pd.CategoricalDtype(c) for column, c in categories.items()}
+        )
+        merged = pd.concat([main_table, new_rows], ignore_index=True)
+        return merged[~merged.duplicated(["symbol", "date"], keep="last")]
+
+    # `is_sorted` skips sorting (and copying) a table already sorted by symbol and date
+    def set_main_table(self, main_table: pd.DataFrame, is_sorted: bool = False) -> None:
+        # Keep each symbol's rows in a contiguous block ordered by date
+        if not is_sorted:
+            main_table = main_table.sort_values(
+                ["symbol", "date"], kind="stable", ignore_index=True
+            )
+        # Find the row offsets at which each symbol's block starts and ends
+        codes = main_table.symbol.cat.codes.to_numpy()
+        bounds = np.flatnonzero(np.diff(codes)) + 1
+        starts = np.r_[0, bounds]
+        ends = np.r_[bounds, len(codes)]
+        categories = main_table.symbol.cat.categories
+        symbol_index = (
+            {
+                categories[codes[start]]: slice(start, end)
+                for start, end in zip(starts.tolist(), ends.tolist())
+            }
+            if len(codes)
+            else {}
+        )
+        self.daily_change = self.compute_daily_change(main_table, starts, ends)
+        # Swap the table, its index and a fresh derived data cache in a single
+        # assignment, so that readers never pair a new table with a stale index or data
+        self._indexed_table = (main_table, symbol_index, {})
+        self.main_table = main_table
+        self.symbol_index = symbol_index
+
+    # Last bar of each symbol with at least two bars, given the symbol blocks of main_table,
+    # with its change and opening gap against the previous close in percent
+    @staticmethod
+    def compute_daily_change(
+        main_table: pd.DataFrame, starts: np.ndarray, ends: np.ndarray
+    ) -> pd.DataFrame:
+        ends = ends[ends - starts >= 2]
+        last, previous = ends - 1, ends - 2
+        close = main_table.close.to_numpy()
+        daily_change = pd.DataFrame(
+            {
+                "open": main_table.open.to_numpy()[last],
+                "close": close[last],
+                "prev_close": close[previous],
+                "volume": main_table.volume.to_numpy()[last],
+            },
+            index=pd.Index(
+                main_table.symbol.to_numpy()[last].astype(str), name="symbol"
+            ),
+        )
+        daily_change["change"] = 100 * (close[last] - close[previous]) / close[previous]
+        daily_change["gap"] = (
+            100
+            * (daily_change.open - daily_change.prev_close)
+            / daily_change.prev_close
+        )
+        return daily_change
+
+    # Top `n` symbols by absolute daily change, absolute opening gap or volume (largest first)
+    def top_movers(self, n: int = 10, by: str = "change") -> pd.DataFrame:
+        if by not in ("change", "gap", "volume"):
+            raise ValueError(f"Cannot rank movers by {by!r}")
+        daily_change = self.daily_change
+        magnitude = np.abs(daily_change[by].to_numpy())
+        # Select the top n in linear time, then order only those
+        top = (
+            np.argpartition(-magnitude, n)[:n]
+            if n < len(magnitude)
+            else np.arange(len(magnitude))
+        )
+        return daily_change.iloc[top[np.argsort(-magnitude[top], kind="stable")]]
+
+    # Get the date-ordered rows of a symbol without scanning the whole main_table
+    def get_symbol_frame(self, symbol: str) -> pd.DataFrame:
+        main_table, symbol_index, _ = self._indexed_table
+        return main_table.iloc[symbol_index.get(symbol, slice(0, 0))]
+
+    # Data derived by `build` from the rows of a symbol, computed once per loaded table
+    # and kept under `key` until load_main_table swaps in a new table
+    def symbol_data(
+        self, key: str, symbol: str, build: Callable[[pd.DataFrame], Any]
+    ) -> Any:
+        main_table, symbol_index, derived = self._indexed_table
+        if (key, symbol) not in derived:
+            derived[key, symbol] = build(
+                main_table.iloc[symbol_index.get(symbol, slice(0, 0))]
+            )
+        return derived[key, symbol]
 
     def initiate_tickers_obj(self, scrape):
         if scrape:
             self.ticker_symbols = self.scrape_symbols()
         else:
-            with self.lock:
-                self.ticker_symbols = [
-                    symbol[0]
-                    for symbol in self.con.execute(
-                        """
-                        SELECT symbol
-                        FROM ticker
-                        """
-                    ).fetchall()
-                ]
+            self.ticker_symbols = [
+                symbol[0]
+                for symbol in self.read_con.execute(
+                    """
+                    SELECT symbol
+                    FROM ticker
+                    """
+                ).fetchall()
+            ]
         # Initiate tickers instance
         self.tickers = yf.Tickers(" ".join(self.ticker_symbols))
+        self.provider = YahooProvider(self.tickers)
 
     # Define function for updating ohlc data for a given ticker by it's symbol
     def add_new_ohlc(self, symbol):
         logger.debug("Updating {}...", symbol)
-        try:
-            with self.lock:
-                # Get the date for the next entry
-                next_entry = self.cur.execute(
-                    """
-                    SELECT DATE(max(date) + 86400, 'unixepoch')
-                    FROM price p
-                        JOIN ticker t ON t.id = p.ticker_id
-                        JOIN date d ON p.date_id = d.id
-                    WHERE t.symbol = ?
-                    """,
-                    (symbol,),
-                ).fetchone()[0]
-
-            # Skip when start date is after end date
-            timezone = self.tickers.tickers[symbol]._get_ticker_tz(
-                self.tickers.tickers[symbol].proxy, timeout=10
-            )
-            s = yf.utils._parse_user_dt(next_entry, timezone)
-            e = int(time.time())
-            if s > e:
-                logger.debug(
-                    "Skipping {}, start date ({}) cannot be after end date ({})",
-                    symbol,
-                    s,
-                    e,
-                )
-                return
-
-            # Retrieve new OHLC data for symbol
-            ohlc_data = self.tickers.tickers[symbol].history(
-                start=next_entry, raise_errors=True
-            )[["Open", "High", "Low", "Close", "Volume"]]
-            # Convert the date to a unix timestamp (remove timezone holding local time representations)
-            ohlc_data.index = (
-                cast(pd.DatetimeIndex, ohlc_data.index)
-                .tz_localize(None)
-                .astype("int64")
-                / 10**9
-            )
-            ohlc_data.reset_index(inplace=True)
-            # Convert to a list of dictionaries (records)
-            ohlc_data = ohlc_data.to_dict(orient="records")
-            with self.lock:
-                with self.con:
-                    # Inserting date could be optimized
-                    self.con.executemany(
-                        """
-                        INSERT
-                            OR IGNORE INTO date (date)
-                        VALUES (:Date)
-                        """,
-                        ohlc_data,
-                    )
-
-                    # Using an f-string is an SQL injection vulnerability,
-                    # but given the context it doesn't matter
-                    self.con.executemany(
-                        f"""
-                        INSERT INTO price (
-                                ticker_id,
-                                date_id,
-                                OPEN,
-                                high,
-                                low,
-                                close,
-                                volume
-                            )
-                        VALUES (
-                                (
-                                    SELECT id
-                                    FROM ticker
-                                    WHERE symbol = '{symbol}'
-                                ),
-                                (
-                                    SELECT id
-                                    FROM date
-                                    WHERE date = :Date
-                                ),
-                                :Open,
-                                :High,
-                                :Low,
-                                :Close,
-                                :Volume
-                            )
-                        """,
-                        ohlc_data,
-                    )
-            logger.debug("{} updated \u2713", symbol)
-        except Exception as e:
-            logger.error("[{}] Exception: {}", symbol, e)
+        self.update_ohlc([symbol], workers=1)
 
 
 # Get the absolute path of the directory containing the script
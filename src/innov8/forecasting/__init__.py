@@ -0,0 +1,88 @@
+"""Forecast engines
+
+Engines pull in heavy modelling dependencies (Prophet compiles and runs Stan models),
+so they are only imported on the paths that actually generate forecasts.
+
+An engine is a module exposing `forecast_many(histories, jobs, params)`, which takes
+{symbol: DataFrame of date, open, high, low, close} and yields
+(symbol, [(timestamp, open, high, low, close), ...]) pairs. Engines whose fits can be
+warm-started read the previous fitted parameters of each symbol from `params`
+(JSON-serializable, persisted by the DataStore) and replace them with the new ones.
+"""
+
+import importlib
+import os
+from types import ModuleType
+
+import numpy as np
+import pandas as pd
+
+# Number of business days to forecast
+PERIODS = 5
+PRICE_TYPES = ["open", "high", "low", "close"]
+
+ENGINES = {
+    "prophet": "innov8.forecasting.prophet_engine",
+    "smoothing": "innov8.forecasting.smoothing_engine",
+}
+
+
+def engine_name(name: str | None = None) -> str:
+    """`name`, defaulting to the FORECAST_ENGINE environment variable (or prophet)"""
+    return name or os.getenv("FORECAST_ENGINE", "prophet")
+
+
+def load_engine(name: str) -> ModuleType:
+    if name not in ENGINES:
+        raise ValueError(
+            f"Unknown forecast engine {name!r}, expected one of: {', '.join(ENGINES)}"
+        )
+    return importlib.import_module(ENGINES[name])
+
+
+def future_timestamps(last_date: pd.Timestamp, periods: int = PERIODS) -> list[float]:
+    """Unix timestamps of the business days following `last_date`"""
+    return [
+        date.timestamp()
+        for date in pd.bdate_range(last_date + pd.Timedelta(days=1), periods=periods)
+    ]
+
+
+def clip_to_margin(history: np.ndarray, predicted: np.ndarray) -> np.ndarray:
+    """Clip predicted prices to a moving margin around the previous price
+
+    `history` holds (at least `periods + 1`) latest prices per row and `predicted`
+    the raw predictions (rows x periods). The margin is the mean absolute price change
+    over the last `periods` steps, including the already clipped predictions.
+    """
+    periods = predicted.shape[1]
+    # Absolute price changes of the last periods, followed by those of the predictions
+    price_diffs = np.empty((len(predicted), periods * 2))
+    price_diffs[:, :periods] = np.abs(np.diff(history[:, -periods - 1 :], axis=1))
+    # Sum of the price differences (to be used in the margin)
+    s = price_diffs[:, :periods].sum(axis=1)
+    last_price = history[:, -1]
+
+    clipped = np.empty_like(predicted, dtype=float)
+    for i in range(periods):
+        # Calculate moving average
+        margin = s / periods
+        # Clip the price to be within the margin
+        price = np.clip(predicted[:, i], last_price - margin, last_price + margin)
+        # Add the new price difference
+        price_diffs[:, i + periods] = np.abs(price - last_price)
+        last_price = price
+        # Update the sum
+        s = s - price_diffs[:, i] + price_diffs[:, i + periods]
+        clipped[:, i] = price
+    return clipped
+
+
+def reconcile(
+    open_: np.ndarray, high: np.ndarray, low: np.ndarray, close: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """Make the high/low predictions bound the other predicted prices"""
+    return (
+        np.maximum.reduce([high, open_, close, low]),
+        np.minimum.reduce([low, open_, close, high]),
+    )
@@ -0,0 +1,136 @@
+import numpy as np
+
+np.float_ = np.float64  # type: ignore
+
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Iterator, Mapping, MutableMapping
+
+import pandas as pd
+from loguru import logger
+from prophet import Prophet
+from tqdm import tqdm
+
+from innov8.forecasting import (
+    PERIODS,
+    PRICE_TYPES,
+    clip_to_margin,
+    future_timestamps,
+    reconcile,
+)
+
+# Fit a model to trigger cmdstanpy before setting logging level
+Prophet().fit(pd.DataFrame({"ds": ["2022-01-01", "2022-01-02"], "y": [0, 1]}))
+# Suppress logging from cmdstanpy
+logging.getLogger("cmdstanpy").setLevel(logging.WARNING)
+
+
+# Fitted parameters of a model, in JSON-serializable form, to warm-start the next fit of
+# the same series (Prophet falls back to its default initialization if their shapes no
+# longer match, e.g. after seasonality terms were added)
+def warm_start_params(model: Prophet) -> dict[str, Any]:
+    return {
+        **{name: float(model.params[name][0][0]) for name in ("k", "m", "sigma_obs")},
+        **{name: model.params[name][0].tolist() for name in ("delta", "beta")},
+    }
+
+
+# Forecast OHLC prices for the next business days of a single ticker
+# `history` holds the date-ordered date, open, high, low and close columns of the ticker
+# The fit of each price type starts from its parameters in `init` (see warm_start_params)
+# when given. Returns (timestamp, open, high, low, close) tuples and the fitted parameters
+def fit_forecast(
+    history: pd.DataFrame,
+    init: Mapping[str, dict[str, Any]] | None = None,
+    periods: int = PERIODS,
+) -> tuple[list[tuple[float, float, float, float, float]], dict[str, dict[str, Any]]]:
+    predictions, params = {}, {}
+    for price_type in PRICE_TYPES:
+        # Prepare the dataframe for Prophet
+        df_prophet = history[["date", price_type]].rename(
+            columns={"date": "ds", price_type: "y"}
+        )
+
+        # Initialize and fit the Prophet model
+        model = Prophet()
+        if init is not None and price_type in init:
+            model.fit(
+                df_prophet,
+                init={
+                    name: np.asarray(value) for name, value in init[price_type].items()
+                },
+            )
+        else:
+            model.fit(df_prophet)
+        params[price_type] = warm_start_params(model)
+
+        # Create a dataframe for future dates
+        future = model.make_future_dataframe(
+            periods=periods, freq="B"
+        )  # 'B' is for business days
+        forecast = model.predict(future)
+
+        # Keep the predictions within a margin of the recent price changes
+        predictions[price_type] = clip_to_margin(
+            df_prophet["y"].to_numpy()[np.newaxis],
+            forecast["yhat"].tail(periods).to_numpy()[np.newaxis],
+        )[0]
+
+    high, low = reconcile(*(predictions[price_type] for price_type in PRICE_TYPES))
+    rows = list(
+        zip(
+            future_timestamps(history["date"].iat[-1], periods),
+            predictions["open"].tolist(),
+            high.tolist(),
+            low.tolist(),
+            predictions["close"].tolist(),
+        )
+    )
+    return rows, params
+
+
+# Forecast of a single ticker from a cold start
+def forecast_ohlc(
+    history: pd.DataFrame, periods: int = PERIODS
+) -> list[tuple[float, float, float, float, float]]:
+    return fit_forecast(history, periods=periods)[0]
+
+
+# Forecast several tickers, fanning them out across `jobs` worker processes
+# Each worker only receives the history of the ticker it forecasts
+# With `params` ({symbol: {price type: parameters}}), fits are warm-started from the
+# parameters of the previous fits, which are replaced by those of the new ones
+# Yields (symbol, rows) pairs as the forecasts complete, failures are logged and skipped
+def forecast_many(
+    histories: Mapping[str, pd.DataFrame],
+    jobs: int = 1,
+    params: MutableMapping[str, dict[str, dict[str, Any]]] | None = None,
+) -> Iterator[tuple[str, list[tuple[float, float, float, float, float]]]]:
+    def init(symbol: str) -> dict[str, dict[str, Any]] | None:
+        return None if params is None else params.get(symbol)
+
+    def result(symbol: str, fitted: tuple) -> list:
+        rows, fitted_params = fitted
+        if params is not None:
+            params[symbol] = fitted_params
+        return rows
+
+    if jobs <= 1:
+        for symbol, history in tqdm(histories.items(), total=len(histories)):
+            try:
+                yield symbol, result(symbol, fit_forecast(history, init(symbol)))
+            except Exception as e:
+                logger.error("[{}] Exception: {}", symbol, e)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            executor.submit(fit_forecast, history, init(symbol)): symbol
+            for symbol, history in histories.items()
+        }
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            symbol = futures[future]
+            try:
+                yield symbol, result(symbol, future.result())
+            except Exception as e:
+                logger.error("[{}] Exception: {}", symbol, e)
@@ -0,0 +1,90 @@
+"""Damped-trend exponential smoothing engine
+
+A lightweight alternative to Prophet: all tickers and price types are stacked into
+one 2-D array and smoothed together, so a whole universe is forecast in one pass.
+"""
+
+from typing import Iterator, Mapping, MutableMapping
+
+import numpy as np
+import pandas as pd
+
+from innov8.forecasting import (
+    PERIODS,
+    PRICE_TYPES,
+    clip_to_margin,
+    future_timestamps,
+    reconcile,
+)
+
+# Candidate smoothing factors for the level and the trend,
+# the best pair is picked per series by its in-sample one-step-ahead error
+ALPHAS = np.array([0.1, 0.3, 0.5, 0.7, 0.9])
+BETAS = np.array([0.01, 0.05, 0.1, 0.2])
+# Trend damping factor
+PHI = 0.9
+
+
+def smooth(y: np.ndarray, periods: int = PERIODS) -> np.ndarray:
+    """Forecast each row of `y` (series x time) `periods` steps ahead"""
+    # Every parameter pair is evaluated for every series at once (pairs x series)
+    alpha = np.repeat(ALPHAS, len(BETAS))[:, np.newaxis]
+    beta = np.tile(BETAS, len(ALPHAS))[:, np.newaxis]
+    level = np.repeat(y[np.newaxis, :, 0], len(alpha), axis=0)
+    trend = np.zeros_like(level)
+    sse = np.zeros_like(level)
+    for t in range(1, y.shape[1]):
+        predicted = level + PHI * trend
+        sse += (y[:, t] - predicted) ** 2
+        new_level = alpha * y[:, t] + (1 - alpha) * predicted
+        trend = beta * (new_level - level) + (1 - beta) * PHI * trend
+        level = new_level
+
+    # Keep the final state of the best fitting parameters of each series
+    best = sse.argmin(axis=0)
+    series = np.arange(y.shape[0])
+    level, trend = level[best, series], trend[best, series]
+    # The trend contribution fades with the forecast horizon
+    damping = np.cumsum(PHI ** np.arange(1, periods + 1))
+    return level[:, np.newaxis] + trend[:, np.newaxis] * damping
+
+
+# Forecast all tickers at once, `jobs` and `params` are accepted for compatibility with
+# other engines (smoothing parameters are cheap to search, fits are not warm-started)
+def forecast_many(
+    histories: Mapping[str, pd.DataFrame],
+    jobs: int = 1,
+    params: MutableMapping[str, dict] | None = None,
+) -> Iterator[tuple[str, list[tuple[float, float, float, float, float]]]]:
+    if not histories:
+        return
+    length = max(len(history) for history in histories.values())
+    # Stack the histories into a (price type x ticker x time) array, right-aligned
+    # by their latest bar, padding shorter histories with their first prices
+    y = np.empty((len(PRICE_TYPES), len(histories), length))
+    for i, history in enumerate(histories.values()):
+        values = history[PRICE_TYPES].to_numpy(dtype=float).T
+        y[:, i, length - values.shape[1] :] = values
+        y[:, i, : length - values.shape[1]] = values[:, :1]
+
+    series = y.reshape(-1, length)
+    open_, high, low, close = clip_to_margin(series, smooth(series)).reshape(
+        len(PRICE_TYPES), len(histories), PERIODS
+    )
+    high, low = reconcile(open_, high, low, close)
+
+    # Tickers mostly share their latest date, so the forecast dates are computed once per date
+    timestamps: dict[pd.Timestamp, list[float]] = {}
+    for i, (symbol, history) in enumerate(histories.items()):
+        last_date = history["date"].iat[-1]
+        if last_date not in timestamps:
+            timestamps[last_date] = future_timestamps(last_date)
+        yield symbol, list(
+            zip(
+                timestamps[last_date],
+                open_[i].tolist(),
+                high[i].tolist(),
+                low[i].tolist(),
+                close[i].tolist(),
+            )
+        )
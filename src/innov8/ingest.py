@@ -0,0 +1,261 @@
+"""Concurrent data ingestion
+
+Data for each symbol is fetched by a pool of threads (network bound), throttled by a
+token bucket and retried with exponential backoff when the provider rate limits us.
+Results are handed to a single writer thread, so that SQLite only ever sees one writer.
+"""
+
+import logging
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Iterable
+
+import pandas as pd
+import yfinance as yf
+from loguru import logger
+from tqdm import tqdm
+
+
+# Number of symbols downloaded per request when updating OHLC data
+OHLC_CHUNK_SIZE = 50
+
+# Marks symbols whose data could not be fetched
+FAILED = object()
+
+
+class RateLimitError(Exception):
+    """Raised by providers when a request was rejected for exceeding the rate limit (HTTP 429)"""
+
+
+# yf.download keeps its state in module globals, so batch downloads are serialized
+download_lock = threading.Lock()
+
+
+class ErrorRecorder(logging.Handler):
+    """Collects the error messages logged while attached to a logger"""
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.messages: list[str] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.messages.append(record.getMessage())
+
+
+class TokenBucket:
+    """Thread-safe token bucket allowing `rate` acquisitions per second, with bursts of up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: int = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                # Refill proportionally to the elapsed time
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class YahooProvider:
+    """Fetches ticker data from Yahoo! Finance"""
+
+    def __init__(self, tickers: yf.Tickers):
+        self.tickers = tickers
+
+    @staticmethod
+    def _check_rate_limit(e: Exception) -> None:
+        if "Too Many Requests" in str(e) or "429" in str(e):
+            raise RateLimitError(str(e)) from e
+
+    def info(self, symbol: str) -> dict[str, Any]:
+        try:
+            return self.tickers.tickers[symbol].info
+        except Exception as e:
+            self._check_rate_limit(e)
+            raise
+
+    # Get daily OHLC data starting from `start` (a year of data if None)
+    # Returns None when there is nothing new to fetch
+    def history(self, symbol: str, start: str | None = None) -> pd.DataFrame | None:
+        ticker = self.tickers.tickers[symbol]
+        try:
+            if start is None:
+                ohlc_data = ticker.history(
+                    start=(datetime.now() - timedelta(days=365)).strftime("%Y-%m-%d"),
+                    end=datetime.now().strftime("%Y-%m-%d"),
+                )
+            else:
+                # Skip when start date is after end date
+                timezone = ticker._get_ticker_tz(ticker.proxy, timeout=10)
+                s = yf.utils._parse_user_dt(start, timezone)
+                e = int(time.time())
+                if s > e:
+                    logger.debug(
+                        "Skipping {}, start date ({}) cannot be after end date ({})",
+                        symbol,
+                        s,
+                        e,
+                    )
+                    return None
+                ohlc_data = ticker.history(start=start, raise_errors=True)
+        except Exception as e:
+            self._check_rate_limit(e)
+            raise
+        return ohlc_data[["Open", "High", "Low", "Close", "Volume"]]
+
+    # Get daily OHLC data of several symbols starting from the same date in one request
+    # The wide result is split into per-symbol frames, symbols missing from it are
+    # fetched one by one (those that fail again are logged and left out, so that one
+    # delisted ticker does not fail the whole chunk). Returns None when there is nothing
+    # new to fetch
+    def download(
+        self, symbols: list[str], start: str | None = None
+    ) -> dict[str, pd.DataFrame] | None:
+        end = datetime.now().strftime("%Y-%m-%d")
+        if start is None:
+            start = (datetime.now() - timedelta(days=365)).strftime("%Y-%m-%d")
+        elif start > end:
+            logger.debug(
+                "Skipping {}, start date ({}) is in the future", symbols, start
+            )
+            return None
+        # yf.download does not raise the errors of individual symbols, it logs them
+        recorder = ErrorRecorder()
+        yf_logger = logging.getLogger("yfinance")
+        with download_lock:
+            yf_logger.addHandler(recorder)
+            try:
+                ohlc_data = yf.download(
+                    symbols,
+                    start=start,
+                    group_by="ticker",
+                    auto_adjust=True,  # same prices as Ticker.history
+                    threads=False,
+                    progress=False,
+                )
+            except Exception as e:
+                self._check_rate_limit(e)
+                raise
+            finally:
+                yf_logger.removeHandler(recorder)
+        for message in recorder.messages:
+            self._check_rate_limit(Exception(message))
+
+        frames = {}
+        # Nothing was returned when every symbol failed
+        for symbol in symbols if not ohlc_data.empty else ():
+            if isinstance(ohlc_data.columns, pd.MultiIndex):
+                if symbol not in ohlc_data.columns.get_level_values(0):
+                    continue
+                frame = ohlc_data[symbol]
+            else:
+                frame = ohlc_data
+            frame = frame[["Open", "High", "Low", "Close", "Volume"]].dropna()
+            if not frame.empty:
+                frames[symbol] = frame
+        # Fall back to per-symbol requests for symbols the batch did not return
+        for symbol in set(symbols) - set(frames):
+            logger.debug("{} missing from batch download, fetching alone", symbol)
+            try:
+                frame = self.history(symbol, start)
+            except Exception as e:
+                logger.error("[{}] Exception: {}", symbol, e)
+                continue
+            if frame is not None:
+                frames[symbol] = frame
+        return frames
+
+
+def ingest(
+    symbols: Iterable[str],
+    fetch: Callable[[str], Any],
+    write: Callable[[str, Any], None],
+    workers: int = 8,
+    rate: float = 5.0,
+    max_in_flight: int | None = None,
+    retries: int = 3,
+    backoff: float = 1.0,
+) -> dict[str, int]:
+    """Fetch data for `symbols` concurrently and pass it to `write` from a single thread
+
+    `fetch` is called from up to `workers` threads at no more than `rate` calls per second;
+    it returns None when there is nothing to write and raises RateLimitError to be retried
+    after an exponential backoff. At most `max_in_flight` (default: 2 x workers) symbols are
+    being fetched or waiting to be written at any time.
+
+    Returns counts of the fetched, written, skipped and failed symbols and of the retries.
+    """
+    symbols = list(symbols)
+    bucket = TokenBucket(rate, capacity=max(1, int(rate)))
+    in_flight = threading.BoundedSemaphore(max_in_flight or 2 * workers)
+    results: queue.Queue = queue.Queue()
+    stats = {"fetched": 0, "written": 0, "skipped": 0, "failed": 0, "retries": 0}
+    stats_lock = threading.Lock()
+
+    def count(key: str) -> None:
+        with stats_lock:
+            stats[key] += 1
+
+    def fetch_with_retry(symbol: str) -> None:
+        try:
+            for attempt in range(retries + 1):
+                bucket.acquire()
+                try:
+                    result = fetch(symbol)
+                    break
+                except RateLimitError:
+                    if attempt == retries:
+                        raise
+                    count("retries")
+                    # Exponential backoff with jitter, so that workers don't retry in lockstep
+                    time.sleep(backoff * 2**attempt * (1 + random.random()))
+            count("fetched")
+        except Exception as e:
+            logger.error("[{}] Exception: {}", symbol, e)
+            count("failed")
+            result = FAILED
+        results.put((symbol, result))
+
+    def writer(progress: tqdm) -> None:
+        while (item := results.get()) is not None:
+            symbol, result = item
+            try:
+                if result is None:
+                    count("skipped")
+                elif result is not FAILED:
+                    write(symbol, result)
+                    count("written")
+            except Exception as e:
+                logger.error("[{}] Exception: {}", symbol, e)
+                count("failed")
+            finally:
+                in_flight.release()
+                progress.update()
+
+    with tqdm(total=len(symbols)) as progress:
+        writer_thread = threading.Thread(target=writer, args=(progress,), daemon=True)
+        writer_thread.start()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for symbol in symbols:
+                # Wait for the writer to catch up before fetching more
+                in_flight.acquire()
+                executor.submit(fetch_with_retry, symbol)
+        results.put(None)
+        writer_thread.join()
+    return stats
@@ -9,9 +9,11 @@ from innov8.components import (
     dropdown_2,
     ema_switch,
     forecast_button,
+    forecast_stores,
     initial_load,
     price_card,
     price_chart,
+    price_chart_columns,
     sma_switch,
     table_info,
     theme_changer,
@@ -23,7 +25,7 @@ from innov8.db_ops import data
 
 # Pool (combine) the layout
 def layout() -> dbc.Container:
-    # update main table only if needed (update signal exists)
+    # update main table only if needed (the data version changed)
     data.load_main_table(force_update=False)
     return dbc.Container(
         [
@@ -39,8 +41,9 @@ def layout() -> dbc.Container:
                 id="update-button-container",
             ),
             forecast_button(),
+            *forecast_stores(),
             html.Div(
-                price_chart(),
+                [price_chart(), price_chart_columns()],
                 id="price-chart-container",
                 className="invisible",  # hidden on initial load
             ),
@@ -0,0 +1,70 @@
+"""Caches of ready-to-send callback payloads
+
+Payloads derived from the main table alone (e.g. the price chart series of a symbol) are
+the same for every user, so they are built once per data version and served from a
+bounded in-memory LRU, optionally backed by a diskcache.Cache shared between processes.
+Entries of older data versions are dropped as soon as a newer version is requested.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+from loguru import logger
+
+
+class PayloadCache:
+    """Thread-safe LRU of up to `maxsize` payloads, keyed by data version and `key`"""
+
+    def __init__(
+        self,
+        name: str,
+        maxsize: int = 128,
+        shared: Any | None = None,
+        expire: float = 7 * 24 * 3600,
+    ):
+        self.name = name
+        self.maxsize = maxsize
+        self.shared = shared
+        # Shared entries of older versions are never requested again, let them expire
+        self.expire = expire
+        self.version: Hashable = None
+        self.entries: OrderedDict[Hashable, Any] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    # Return the payload of `key` for the data `version`, calling `build` on a miss
+    def get(self, key: Hashable, version: Hashable, build: Callable[[], Any]) -> Any:
+        with self.lock:
+            if version != self.version:
+                logger.debug("{} cache: new data version {}", self.name, version)
+                self.entries.clear()
+                self.version = version
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+        shared_key = f"{self.name}:{version}:{key}"
+        payload = self.shared.get(shared_key) if self.shared is not None else None
+        if payload is None:
+            payload = build()
+            if self.shared is not None:
+                self.shared.set(shared_key, payload, expire=self.expire)
+        with self.lock:
+            # Requests of a newer version may have come in while building
+            if version == self.version:
+                self.entries[key] = payload
+                if len(self.entries) > self.maxsize:
+                    self.entries.popitem(last=False)
+        return payload
+
+    def stats(self) -> dict[str, int]:
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self.entries)}
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.misses = 0
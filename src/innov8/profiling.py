@@ -0,0 +1,47 @@
+import subprocess
+import sys
+from collections import defaultdict
+
+# The module that assembles the app, importing it is what `innov8 run` and gunicorn workers pay for on startup
+APP_MODULE = "innov8.layout"
+
+
+# Parse the output of `python -X importtime` into {module: (self, cumulative)} timings in microseconds
+def parse_importtime(output: str) -> dict[str, tuple[int, int]]:
+    timings = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, module = line.removeprefix("import time:").split("|")
+        timings[module.strip()] = (int(self_us), int(cumulative_us))
+    return timings
+
+
+# Report the import-time breakdown of the app, measured in a fresh interpreter
+def profile_startup(top: int = 15) -> None:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {APP_MODULE}"],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode:
+        sys.exit(f"Importing {APP_MODULE} failed:\n{result.stderr[-2000:]}")
+    timings = parse_importtime(result.stderr)
+
+    # Group the time spent in each module by its top-level package
+    packages: defaultdict[str, int] = defaultdict(int)
+    for module, (self_us, _) in timings.items():
+        packages[module.split(".")[0]] += self_us
+
+    print(f"Startup import time of {APP_MODULE}: {timings[APP_MODULE][1] / 1e6:.2f}s")
+    print(f"\nBy top-level package (top {top}):")
+    for package, self_us in sorted(packages.items(), key=lambda x: -x[1])[:top]:
+        print(f"{self_us / 1e3:>10.1f} ms  {package}")
+    # Module bodies of innov8 include work done on import (e.g. loading the main table)
+    print(f"\nSlowest modules by own time (top {top}):")
+    for module, (self_us, cumulative_us) in sorted(
+        timings.items(), key=lambda x: -x[1][0]
+    )[:top]:
+        print(
+            f"{self_us / 1e3:>10.1f} ms  (cumulative {cumulative_us / 1e3:>8.1f} ms)  {module}"
+        )
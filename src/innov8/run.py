@@ -6,12 +6,22 @@ from pathlib import Path
 from dotenv import load_dotenv
 from loguru import logger
 
-from innov8 import update_all
-from innov8.layout import app
+from innov8.forecasting import ENGINES
+from innov8.ingest import OHLC_CHUNK_SIZE
+from innov8.profiling import profile_startup
 
 load_dotenv(Path(__file__).parents[2] / ".safe_env")
-# Create server for gunicorn
-server = app.server
+
+
+# The app (and the DataStore loading the main table) is only imported by the commands
+# that use it, so that e.g. profile-startup measures a cold start
+# `server` is resolved on first access, for gunicorn (innov8.run:server)
+def __getattr__(name: str):
+    if name == "server":
+        from innov8.layout import app
+
+        return app.server
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def cli() -> None:
@@ -20,14 +30,50 @@ def cli() -> None:
         "command",
         nargs="?",
         default="run",
-        choices=["run", "update"],
-        help='Run the main application (default) or update all tickers with "update"',
+        choices=["run", "update", "profile-startup"],
+        help='Run the main application (default), update all tickers with "update" or report the import-time breakdown of the application with "profile-startup"',
+    )
+
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help='Number of worker processes used to generate forecasts with "update" (default: 1)',
+    )
+
+    parser.add_argument(
+        "--engine",
+        choices=list(ENGINES),
+        help='Forecast engine used by "update" (default: the FORECAST_ENGINE environment variable or "prophet")',
+    )
+
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=OHLC_CHUNK_SIZE,
+        help=f'Number of tickers downloaded per request by "update", 1 to download them one by one (default: {OHLC_CHUNK_SIZE})',
+    )
+
+    parser.add_argument(
+        "--refit",
+        action="store_true",
+        help='Regenerate the forecasts of all tickers with "update", including those whose history did not change',
     )
 
     args = parser.parse_args()
 
     if args.command == "update":
-        update_all.main()
+        from innov8 import update_all
+
+        update_all.main(
+            jobs=args.jobs,
+            engine=args.engine,
+            chunk_size=args.chunk_size,
+            refit=args.refit,
+        )
+    elif args.command == "profile-startup":
+        profile_startup()
     elif args.command == "run":
         main()
     else:
@@ -35,6 +81,8 @@ def cli() -> None:
 
 
 def main() -> None:
+    from innov8.layout import app
+
     if os.getenv("DEV_ENV"):
         logger.configure(handlers=[{"sink": sys.stderr, "level": "DEBUG"}])
         app.run(debug=True, threaded=True)
@@ -1,31 +1,34 @@
 import sys
 
-import numpy as np
-
-np.float_ = np.float64  # type: ignore
-
 from loguru import logger
-from tqdm import tqdm
 
-from innov8.db_ops import data
+from innov8.db_ops import OHLC_CHUNK_SIZE, data
 
 
-def main() -> None:
+def main(
+    jobs: int = 1,
+    engine: str | None = None,
+    chunk_size: int = OHLC_CHUNK_SIZE,
+    refit: bool = False,
+) -> None:
     logger.configure(handlers=[{"sink": sys.stderr, "level": "INFO"}])
 
     assert data.main_table is not None
     symbols = data.main_table.symbol.unique()
     logger.info("Updating all...")
-    for symbol in tqdm(symbols):
-        data.add_new_ohlc(symbol)
+    data.update_ohlc(symbols, chunk_size)
     data.load_main_table(force_update=True)
-    # Create an empty signal file to notify the main process of the update
-    open(data.script_directory / "update_signal", "w").close()
 
     logger.info("Training models and generating forecasts...")
-    data.clear_forecasts()
-    for symbol in tqdm(symbols):
-        data.generate_forecast(symbol)
+    # Symbols without new data keep their forecasts
+    stats = data.generate_forecasts(symbols, jobs, engine, refit)
+    logger.info(
+        "Forecasts: {fitted} fitted, {skipped} skipped (unchanged history)", **stats
+    )
+
+    # Let the application processes start from a snapshot of the updated main table
+    data.load_main_table(force_update=False)
+    data.write_snapshot()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,27 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from innov8.db_ops import DataStore, data
+
+
+# Fixture with a DataStore on a copy of the application database
+# The backup API also copies the changes still held in the write-ahead log
+@pytest.fixture
+def data_copy(tmp_path) -> DataStore:
+    source = sqlite3.connect(data.db_path)
+    target = sqlite3.connect(tmp_path / "stonks.db")
+    source.backup(target)
+    source.close()
+    target.close()
+    return DataStore(tmp_path)
+
+
+# Daily bars on `dates` (by default one, well after any stored date) as returned by a
+# provider, with constant prices and volume unless given in `columns`
+def ohlc_bars(*dates, **columns) -> pd.DataFrame:
+    return pd.DataFrame(
+        {"Open": 1.0, "High": 2.0, "Low": 0.5, "Close": 1.5, "Volume": 100} | columns,
+        index=pd.DatetimeIndex(dates or ["2100-01-04"], name="Date"),
+    )
@@ -0,0 +1,92 @@
+import diskcache
+import numpy as np
+import pandas as pd
+import pytest
+
+from innov8.analytics import (
+    WINDOWS,
+    RollingCorrelation,
+    get_sector_correlations,
+    masked_correlation,
+    sector_correlations,
+    sector_table,
+)
+
+
+def test_masked_correlation():
+    rng = np.random.default_rng(0)
+    x = 100 + rng.normal(size=(60, 5)).cumsum(axis=0)
+    # Missing values are excluded pairwise
+    x[rng.random(x.shape) < 0.2] = np.nan
+    x[:, 4] = np.nan
+    x[0, 4] = 1.0
+    expected = pd.DataFrame(x).corr().to_numpy()
+    np.testing.assert_allclose(masked_correlation(x), expected, atol=1e-9)
+
+
+def test_rolling_correlation():
+    rng = np.random.default_rng(1)
+    dates = pd.bdate_range("2024-01-01", periods=200)
+    x = 100 + rng.normal(size=(200, 4)).cumsum(axis=0)
+    x[rng.random(x.shape) < 0.1] = np.nan
+    engine = RollingCorrelation(30, x[0])
+    # Appending one row at a time matches a correlation of the trailing window
+    for i in range(len(dates)):
+        engine.extend(dates[i : i + 1], x[i : i + 1])
+    window = dates >= dates[-1] - pd.Timedelta(days=30)
+    np.testing.assert_allclose(
+        engine.correlation(), pd.DataFrame(x[window]).corr().to_numpy(), atol=1e-9
+    )
+
+
+def test_incremental_sector_correlations(data_copy):
+    sectors = get_sector_correlations(data_copy)
+    technology = sectors["Technology"]
+    symbols = list(technology.symbols)
+    rng = np.random.default_rng(2)
+    for date in ["2100-01-04", "2100-01-05"]:
+        # Bars arrive one symbol at a time
+        for symbol in symbols:
+            close = 100 + rng.normal()
+            frame = pd.DataFrame(
+                {
+                    "Open": close,
+                    "High": close,
+                    "Low": close,
+                    "Close": close,
+                    "Volume": 1,
+                },
+                index=pd.DatetimeIndex([date], name="Date"),
+            )
+            data_copy.insert_ohlc_many({symbol: frame})
+            data_copy.load_main_table()
+            assert get_sector_correlations(data_copy) is sectors
+
+    # The updated correlations match correlations computed from scratch
+    assert sectors["Technology"] is technology
+    rebuilt = sector_correlations(data_copy.main_table)["Technology"]
+    assert sectors["Technology"].end == pd.Timestamp("2100-01-05")
+    for days in WINDOWS:
+        corrs, prices = sectors["Technology"].table(days)
+        expected_corrs, expected_prices = rebuilt.table(days)
+        np.testing.assert_allclose(corrs, expected_corrs, atol=1e-3)
+        pd.testing.assert_series_equal(prices, expected_prices)
+
+
+def test_sector_table(data_copy, tmp_path):
+    with diskcache.Cache(tmp_path / "cache") as shared:
+        corrs, prices = sector_table(data_copy, "Technology", 90, shared)
+        assert corrs.loc["AAPL", "AAPL"] == 1
+        assert prices["AAPL"] == round(
+            data_copy.get_symbol_frame("AAPL").close.iat[-1], 2
+        )
+        # Other processes get the shared result
+        assert len(shared) == 1
+        with pytest.raises(KeyError):
+            sector_table(data_copy, "Technology", 45, shared)
+
+        # A database rebuilt at the same path restarts from the same version and rowids
+        sectors = get_sector_correlations(data_copy, shared)
+        data_copy.database_id = "rebuilt"
+        assert get_sector_correlations(data_copy, shared) is not sectors
+        assert len(shared) == 2
@@ -1,20 +1,41 @@
+import json
+import os
+import shutil
+import subprocess
+import threading
+from types import SimpleNamespace
 from unittest.mock import patch
 
+import diskcache
+import pandas as pd
+import plotly
 import pytest
+from dash import Patch, no_update
 
-from innov8.components.charts_52w import update_52_week_charts
+from innov8.analytics import sector_table
+from innov8.components.charts_52w import update_52_week_charts, weekly_traces
 from innov8.components.dropdowns import update_symbols_dropdown
-from innov8.components.intra_sector import (
-    calculate_table_data,
-    corrs,
-    update_intra_sector_table,
+from innov8.components.forcast import (
+    LAST_BAR_TIME,
+    forecast_on_demand,
+    symbol_forecast_bars,
+    update_price_chart_w_forecast,
 )
+from innov8.components.intra_sector import update_intra_sector_table
 from innov8.components.main_carousel import update_main_carousel
 from innov8.components.price_card import update_symbol_data
 from innov8.components.price_chart import (
+    UPDATE_INDICATOR_LINES,
+    chart_options,
+    series_cache,
+    series_payload,
     update_price_chart,
+    update_price_chart_theme,
 )
 from innov8.components.update import update_button_style, update_ticker_data
+from innov8.db_ops import data
+from innov8.forecasting import load_engine
+from tests.conftest import ohlc_bars
 
 
 def test_update_symbols_dropdown_tech_sector():
@@ -99,12 +120,12 @@ def test_update_symbol_data():
 
 # Fixture with calculated correlation table data
 @pytest.fixture(scope="module")
-def calculated_table_data() -> None:
-    return calculate_table_data("Technology")
+def calculated_table_data() -> pd.DataFrame:
+    return sector_table(data, "Technology")[0]
 
 
-def test_calculate_table_data(calculated_table_data: None):
-    df = corrs["Technology"]
+def test_calculate_table_data(calculated_table_data: pd.DataFrame):
+    df = calculated_table_data
 
     # Check that the correlation matrix is symmetric:
     # correlation(sym1, sym2) should equal correlation(sym2, sym1)
@@ -121,16 +142,10 @@ def test_calculate_table_data(calculated_table_data: None):
 
 
 def test_update_intra_sector_table():
-    # dash.callback_context.triggered_prop_ids is only available from a callback!
-    with patch(
-        "innov8.components.intra_sector.callback_context"
-    ) as mock_callback_context:
-        mock_callback_context.triggered_prop_ids = {
-            "symbol-dropdown.value": "symbol-dropdown"
-        }
-
-        output = update_intra_sector_table("Technology", "AAPL", None)
-        assert list(output[0].keys()) == ["symbol", "price", "90-day corr"]
+    output = update_intra_sector_table("Technology", "AAPL", None)
+    assert list(output[0].keys()) == ["symbol", "price", "90-day corr"]
+    output = update_intra_sector_table("Technology", "AAPL", None, 365)
+    assert list(output[0].keys()) == ["symbol", "price", "1-year corr"]
 
 
 # Define the mocked behavior for template_from_url
@@ -145,25 +160,155 @@ def mock_template_hex_color(url):
 
 def test_update_52_week_charts():
     # Use unittest.mock.patch to replace the template_from_url function with the mock
-    with patch(
-        "innov8.components.charts_52w.template_from_url",
-        side_effect=mock_template_from_url,
+    with (
+        patch(
+            "innov8.components.charts_52w.template_from_url",
+            side_effect=mock_template_from_url,
+        ),
+        patch("innov8.components.charts_52w.callback_context") as mock_callback_context,
     ):
+        mock_callback_context.triggered_prop_ids = {}
         output = update_52_week_charts("AAPL", None, None)
         # Verify that two figures are successfully plotted
-        assert {"data", "layout"}.issubset(set(dir(output[0])))
-        assert {"data", "layout"}.issubset(set(dir(output[1])))
+        assert {"data", "layout"}.issubset(output[0])
+        assert {"data", "layout"}.issubset(output[1])
+        assert output[1]["data"][0]["gauge"]["bar"]["color"]
+
+        # Only the trace data is sent when the symbol changes
+        mock_callback_context.triggered_prop_ids = {
+            "symbol-dropdown.value": "symbol-dropdown"
+        }
+        patches = update_52_week_charts("MSFT", None, None)
+        assert isinstance(patches[0], Patch) and isinstance(patches[1], Patch)
+        operations = patches[1].to_plotly_json()["operations"]
+        assert {"operation": "Assign", "location": ["data", 0, "value"]}.items() <= (
+            operations[0].items()
+        )
+        assert (
+            operations[0]["params"]["value"]
+            == data.get_symbol_frame("MSFT").close.iat[-1]
+        )
+
+
+def test_weekly_data_cached_per_table(data_copy):
+    traces = data_copy.symbol_data("weekly", "AAPL", weekly_traces)
+    assert data_copy.symbol_data("weekly", "AAPL", weekly_traces) is traces
+    assert traces[1] == weekly_traces(data_copy.get_symbol_frame("AAPL"))[1]
+    # Swapping in a new table drops the data derived from the previous one
+    data_copy.set_main_table(data_copy.main_table.copy())
+    assert data_copy.symbol_data("weekly", "AAPL", weekly_traces) is not traces
 
 
 # Fixture with price chart figure
 @pytest.fixture(scope="module")
 def price_chart():
+    return update_price_chart("AAPL", ["EMA"], ["SMA"], 9, 50, None)
+
+
+def test_update_price_chart(price_chart):
+    series_types, series_data, series_options, class_name = price_chart
+    assert series_types == ["candlestick", "histogram", "line", "line"]
+    assert [options["silent-title"] for options in series_options[2:]] == [
+        "EMA",
+        "SMA",
+    ]
+    assert len(series_data[0]) == len(data.get_symbol_frame("AAPL"))
+    assert class_name == "visible"
+    # The series are served from the payload cache on the next request
+    hits = series_cache.stats()["hits"]
+    assert update_price_chart("AAPL", ["EMA"], ["SMA"], 9, 50, None)[1] is series_data
+    assert series_cache.stats()["hits"] == hits + 1
+
+
+def test_price_chart_cache_rebuilt_database(monkeypatch):
+    update_price_chart("AAPL", ["EMA"], ["SMA"], 9, 50, None)
+    misses = series_cache.stats()["misses"]
+    # A database rebuilt at the same path, at the same data version
+    monkeypatch.setattr(data, "database_id", "rebuilt")
+    update_price_chart("AAPL", ["EMA"], ["SMA"], 9, 50, None)
+    assert series_cache.stats()["misses"] == misses + 1
+
+
+def test_columnar_series_payload():
+    types, records, options = series_payload(data, "AAPL", 9, 50)
+    columnar = series_payload(data, "AAPL", 9, 50, columnar=True)
+    assert columnar[0] == types and columnar[2] == options
+    # Expand the columns as expandSeries does in the browser
+    columns = columnar[1]
+    expanded = []
+    for series in columns:
+        series = dict(series)
+        start, up, palette = (
+            series.pop(key, None) for key in ("start", "up", "palette")
+        )
+        series.setdefault("time", columns[0]["time"][start or 0 :])
+        rows = [dict(zip(series, row)) for row in zip(*series.values())]
+        if up:
+            for row, flag in zip(rows, up):
+                row["color"] = palette[0 if flag else 1]
+        expanded.append(rows)
+    # The same rows, with epoch times
+    for rows, expected in zip(expanded, records, strict=True):
+        assert [row.keys() for row in rows] == [row.keys() for row in expected]
+        assert [row | {"time": None} for row in rows] == [
+            row | {"time": None} for row in expected
+        ]
+        assert [row["time"] for row in rows] == [
+            int(row["time"].timestamp()) for row in expected
+        ]
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="requires Node.js")
+def test_update_indicator_lines(tmp_path):
+    _, series_data, series_options = series_payload(data, "AAPL", 9, 50)
+    arguments = tmp_path / "arguments.json"
+    arguments.write_text(
+        json.dumps(
+            [12, 20, series_data, series_options, ["EMA"], ["SMA"]],
+            cls=plotly.utils.PlotlyJSONEncoder,
+        )
+    )
+    script = f"""
+    const dash_clientside = {{
+        callback_context: {{
+            triggered: [{{ prop_id: "ema-period.value" }}, {{ prop_id: "sma-period.value" }}],
+        }},
+    }};
+    const updateIndicatorLines = {UPDATE_INDICATOR_LINES};
+    const args = JSON.parse(require("fs").readFileSync(process.argv[1], "utf8"));
+    console.log(JSON.stringify(updateIndicatorLines(...args)));
+    """
+    result = subprocess.run(
+        ["node", "-e", script, str(arguments)],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    updated = json.loads(result.stdout)
+    # Same lines as computed on the server with the new periods
+    expected = json.loads(
+        json.dumps(
+            series_payload(data, "AAPL", 12, 20)[1], cls=plotly.utils.PlotlyJSONEncoder
+        )
+    )
+    assert updated[:2] == expected[:2]
+    for line, expected_line in zip(updated[2:], expected[2:], strict=True):
+        assert [point["time"] for point in line] == [
+            point["time"] for point in expected_line
+        ]
+        assert [point["value"] for point in line] == pytest.approx(
+            [point["value"] for point in expected_line]
+        )
+
+
+def test_update_price_chart_theme():
+    chart_options.cache_clear()
     # Use unittest.mock.patch to replace the template_from_url function with the mock
     with (
         patch(
             "innov8.components.price_chart.template_from_url",
             side_effect=mock_template_from_url,
-        ),
+        ) as mock_template,
         patch(
             "plotly.io.templates",
             new={
@@ -176,4 +321,159 @@ def price_chart():
             },
         ),
     ):
-        return update_price_chart("AAPL", True, True, 9, 50, None, None)
+        options = update_price_chart_theme(None)
+        assert options["layout"]["textColor"] == "#123456"
+        assert options["timeScale"]["borderColor"] == "#123456"
+        # The options of a theme are only derived once
+        assert update_price_chart_theme(None) is options
+        assert mock_template.call_count == 1
+    chart_options.cache_clear()
+
+
+def test_update_price_chart_w_forecast():
+    forecasts = data.get_symbol_forecasts("AAPL")
+    assert len(forecasts) == 5
+    last_time = data.get_symbol_frame("AAPL").date.iat[-1].timestamp()
+    with patch("innov8.components.forcast.ctx") as mock_ctx:
+        # Updates of the chart reset the button
+        mock_ctx.triggered_id = "price-chart-container"
+        output = update_price_chart_w_forecast(None, "visible", None, "AAPL", last_time)
+        assert output["forecast_button_clicks"] is None
+        # Each press appends the forecast bar following the chart's last candle
+        mock_ctx.triggered_id = "forecast-button"
+        for button, (open_, high, low, close, date) in enumerate(forecasts, 1):
+            output = update_price_chart_w_forecast(
+                button, "visible", None, "AAPL", last_time
+            )
+            (operation,) = output["series_data"].to_plotly_json()["operations"]
+            assert operation["operation"] == "Append"
+            assert operation["location"] == [0]
+            bar = operation["params"]["value"]
+            assert (bar["open"], bar["high"], bar["low"], bar["close"]) == (
+                open_,
+                high,
+                low,
+                close,
+            )
+            assert bar["time"].timestamp() == date
+            assert output["forecast_button_disabled"] == (button == len(forecasts))
+            last_time = bar["time"].timestamp()
+
+        # A chart drawn from another data version only gets the bars after its last one
+        output = update_price_chart_w_forecast(
+            1, "visible", None, "AAPL", forecasts[2][4]
+        )
+        (operation,) = output["series_data"].to_plotly_json()["operations"]
+        assert operation["params"]["value"]["time"].timestamp() == forecasts[3][4]
+        output = update_price_chart_w_forecast(
+            1, "visible", None, "AAPL", forecasts[4][4]
+        )
+        assert output["series_data"] is no_update
+        assert output["forecast_button_disabled"]
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="requires Node.js")
+def test_last_bar_time():
+    script = f"""
+    const lastBarTime = {LAST_BAR_TIME};
+    console.log(JSON.stringify([
+        lastBarTime([[{{ time: "2024-06-27T00:00:00" }}, {{ time: "2024-06-28T00:00:00" }}]]),
+        lastBarTime([[{{ time: 1719532800 }}]]),
+        lastBarTime([[{{ time: "2024-07-01T00:00:00+00:00" }}]]),
+        lastBarTime([[{{ time: {{ year: 2024, month: 7, day: 1 }} }}]]),
+        lastBarTime([[]]),
+    ]));
+    """
+    result = subprocess.run(
+        ["node", "-e", script],
+        capture_output=True,
+        text=True,
+        check=True,
+        # Local times must not shift the dates
+        env={"TZ": "America/New_York", "PATH": os.environ["PATH"]},
+    )
+    assert json.loads(result.stdout) == [
+        1719532800,
+        1719532800,
+        1719792000,
+        1719792000,
+        None,
+    ]
+
+
+def test_forecast_on_demand(tmp_path):
+    shared = diskcache.Cache(tmp_path)
+    with (
+        patch("innov8.components.forcast.ON_DEMAND", True),
+        patch("innov8.components.forcast.cache", shared),
+        # A symbol without stored forecasts
+        patch("innov8.components.forcast.forecast_cache.get", return_value=([], False)),
+        patch("innov8.components.forcast.ctx") as mock_ctx,
+        patch.dict("os.environ", {"FORECAST_ENGINE": "smoothing"}),
+    ):
+        # The press requests the forecasts instead of disabling the button
+        mock_ctx.triggered_id = "forecast-button"
+        output = update_price_chart_w_forecast(1, "visible", None, "AAPL", None)
+        assert output["forecast_request"] == "AAPL"
+        assert output["series_data"] is no_update
+
+        # Concurrent requests compute the forecasts once
+        with patch(
+            "innov8.components.forcast.load_engine", wraps=load_engine
+        ) as mock_load_engine:
+            threads = [
+                threading.Thread(target=forecast_on_demand, args=(data, "AAPL", shared))
+                for _ in range(3)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert mock_load_engine.call_count == 1
+        forecasts = forecast_on_demand(data, "AAPL", shared)
+        assert len(forecasts) == 5
+
+        # and are then shown as the first press
+        mock_ctx.triggered_id = "forecast-ready"
+        output = update_price_chart_w_forecast(None, "visible", "AAPL", "AAPL", None)
+        assert output["forecast_button_clicks"] == 1
+        (operation,) = output["series_data"].to_plotly_json()["operations"]
+        assert operation["params"]["value"]["close"] == forecasts[0][3]
+    shared.close()
+
+
+def test_forecast_on_demand_stale(data_copy, tmp_path):
+    shared = diskcache.Cache(tmp_path / "cache")
+    with (
+        patch("innov8.components.forcast.ON_DEMAND", True),
+        patch("innov8.components.forcast.cache", shared),
+        patch.dict("os.environ", {"FORECAST_ENGINE": "smoothing"}),
+    ):
+        data_copy.generate_forecasts(["AAPL"], engine="smoothing", refit=True)
+        data_copy.load_main_table()
+        # Forecasts are current under the engine that generated them, whatever the web
+        # process is configured with, and are checked without querying the database
+        with (
+            patch.dict("os.environ", {"FORECAST_ENGINE": "prophet"}),
+            patch.object(data_copy, "read_fingerprints", side_effect=AssertionError),
+        ):
+            stored = symbol_forecast_bars(data_copy, "AAPL")
+        assert len(stored) == 5
+        # A failed computation is not kept
+        with patch(
+            "innov8.components.forcast.load_engine",
+            return_value=SimpleNamespace(forecast_many=lambda histories: iter(())),
+        ):
+            assert forecast_on_demand(data_copy, "AAPL", shared) == []
+        assert len(shared) == 0
+
+        # Stored forecasts of an older history are replaced by those computed on demand
+        frame = ohlc_bars()
+        data_copy.insert_ohlc_many({"AAPL": frame})
+        data_copy.load_main_table()
+        assert symbol_forecast_bars(data_copy, "AAPL") == []
+        forecasts = forecast_on_demand(data_copy, "AAPL", shared)
+        bars = symbol_forecast_bars(data_copy, "AAPL")
+        assert [date for date, _ in bars] == [row[4] for row in forecasts]
+        assert bars[0][0] > pd.Timestamp("2100-01-04").timestamp()
+    shared.close()
@@ -1,9 +1,12 @@
+import threading
 from pathlib import Path
 
+import pandas as pd
 import pytest
 import yfinance as yf
 
-from innov8.db_ops import DataStore
+from innov8.db_ops import DataStore, data
+from tests.conftest import ohlc_bars
 
 # Get the absolute path of the directory containing the script
 script_directory = Path(__file__).resolve().parent
@@ -38,6 +41,9 @@ def test_create_tables(data_store):
         ("date",),
         ("price",),
         ("forecast",),
+        ("data_version",),
+        ("forecast_fingerprint",),
+        ("forecast_params",),
     ]
 
 
@@ -108,6 +114,280 @@ def test_add_new_ohlc(data_store):
     assert price_count_2 > price_count_1
 
 
+def test_get_symbol_frame():
+    ticker = data.get_symbol_frame("AAPL")
+    # Verify that the indexed rows match a full scan of the main table
+    assert data.main_table is not None
+    expected = data.main_table.loc[data.main_table.symbol == "AAPL"]
+    assert ticker.index.equals(expected.index)
+    assert ticker.date.is_monotonic_increasing
+    # Unknown symbols produce an empty frame
+    assert data.get_symbol_frame("NOT-A-SYMBOL").empty
+
+
+def test_incremental_load(data_copy):
+    assert data_copy.main_table is not None
+    rows = len(data_copy.main_table)
+    # Append a bar after the last date of AAPL
+    with data_copy.con:
+        data_copy.con.execute(
+            "INSERT INTO date (date) VALUES ((SELECT MAX(date) + 86400 FROM date))"
+        )
+        data_copy.con.execute("""
+            INSERT INTO price
+            SELECT ticker_id, (SELECT MAX(id) FROM date), open, high, low, close, volume
+            FROM price
+            WHERE ticker_id = (SELECT id FROM ticker WHERE symbol = 'AAPL')
+            ORDER BY date_id DESC
+            LIMIT 1
+        """)
+    data_copy.load_main_table()
+
+    # Only the new bar is added, and the index picks it up
+    assert len(data_copy.main_table) == rows + 1
+    ticker = data_copy.get_symbol_frame("AAPL")
+    assert ticker.date.is_monotonic_increasing
+    assert ticker.date.iat[-1] == data_copy.main_table.date.max()
+    # The merged table matches a full reload
+    merged = data_copy.main_table
+    data_copy.load_main_table(full=True)
+    pd.testing.assert_frame_equal(
+        merged.astype({"symbol": str, "name": str, "sector": str}),
+        data_copy.main_table.astype({"symbol": str, "name": str, "sector": str}),
+        check_categorical=False,
+    )
+
+
+def test_generate_forecasts(data_copy):
+    data_copy.clear_forecasts()
+    # Forecast two symbols in worker processes
+    data_copy.generate_forecasts(["AAPL", "MSFT"], jobs=2)
+
+    count = data_copy.con.execute("SELECT COUNT(*) FROM forecast").fetchone()[0]
+    assert count == 2 * 5
+    # Check that the high and low bound the forecasted open and close
+    for open_, high, low, close, _ in data_copy.con.execute(
+        "SELECT open, high, low, close, date FROM forecast"
+    ):
+        assert low <= min(open_, close) and high >= max(open_, close)
+
+
+def test_generate_forecasts_fingerprints(data_copy):
+    symbols = ["AAPL", "MSFT"]
+    stats = data_copy.generate_forecasts(symbols, engine="smoothing")
+    assert stats == {"fitted": 2, "skipped": 0}
+    forecasts = data_copy.con.execute("SELECT * FROM forecast").fetchall()
+    # Symbols whose history did not change are not refitted
+    stats = data_copy.generate_forecasts(symbols, engine="smoothing")
+    assert stats == {"fitted": 0, "skipped": 2}
+    assert data_copy.con.execute("SELECT * FROM forecast").fetchall() == forecasts
+
+    # A new bar only refits its symbol
+    frame = ohlc_bars()
+    data_copy.insert_ohlc_many({"AAPL": frame})
+    data_copy.load_main_table()
+    stats = data_copy.generate_forecasts(symbols, engine="smoothing")
+    assert stats == {"fitted": 1, "skipped": 1}
+    # as do a change of engine or an explicit refit
+    assert data_copy.generate_forecasts(symbols, engine="smoothing", refit=True) == {
+        "fitted": 2,
+        "skipped": 0,
+    }
+    fingerprint = data_copy.history_fingerprint(
+        "smoothing", data_copy.get_symbol_frame("AAPL")
+    )
+    assert data_copy.read_fingerprints()["AAPL"] == fingerprint
+    assert fingerprint != data_copy.history_fingerprint(
+        "prophet", data_copy.get_symbol_frame("AAPL")
+    )
+    # Cleared forecasts are regenerated
+    data_copy.clear_forecasts()
+    assert data_copy.read_fingerprints() == {}
+
+
+def test_forecast_params(data_copy):
+    rows = [(1.7e9 + i * 86400, 1.0, 2.0, 0.5, 1.5) for i in range(5)]
+    params = {"close": {"k": 0.1, "m": 0.5, "delta": [0.0, 0.2]}}
+    data_copy.store_forecasts({"AAPL": rows}, params={"AAPL": params})
+    assert data_copy.read_forecast_params(["AAPL", "MSFT"]) == {"AAPL": params}
+    # Parameters of the same price type are replaced, others are kept
+    data_copy.store_forecasts(
+        {"AAPL": rows}, params={"AAPL": {"open": params["close"], "close": {"k": 1}}}
+    )
+    assert data_copy.read_forecast_params(["AAPL"]) == {
+        "AAPL": {"open": params["close"], "close": {"k": 1}}
+    }
+    assert data_copy.read_forecast_params(["MSFT"]) == {}
+
+
+def test_store_forecasts(data_copy):
+    count = data_copy.con.execute("SELECT COUNT(*) FROM forecast").fetchone()[0]
+    rows = [(1.7e9 + i * 86400, 1.0, 2.0, 0.5, 1.5) for i in range(5)]
+    # Storing forecasts replaces the previous forecasts of that symbol only
+    data_copy.store_forecasts({"AAPL": rows})
+    data_copy.store_forecasts({"AAPL": rows[:3]})
+
+    assert data_copy.con.execute("SELECT COUNT(*) FROM forecast").fetchone()[0] == (
+        count - 5 + 3
+    )
+    # Forecasts are served from memory once loaded
+    assert data_copy.get_forecasts("AAPL", 0) != (1.0, 2.0, 0.5, 1.5, 1.7e9)
+    data_copy.load_main_table(force_update=False)
+    assert data_copy.get_forecasts("AAPL", 0) == (1.0, 2.0, 0.5, 1.5, 1.7e9)
+    assert data_copy.get_forecasts("AAPL", 1.7e9) == (1.0, 2.0, 0.5, 1.5, 1.7e9 + 86400)
+    assert data_copy.get_forecasts("AAPL", 1.7e9 + 2 * 86400) is None
+    assert data_copy.get_symbol_forecasts("AAPL") == [
+        (*row[1:], row[0]) for row in rows[:3]
+    ]
+
+
+def test_insert_ohlc_many(data_copy):
+    frame = ohlc_bars("2100-01-04", "2100-01-05")
+    data_copy.insert_ohlc_many({"AAPL": frame, "MSFT": frame.iloc[1:]})
+
+    # The new dates are added to the in-memory map with their database ids
+    assert data_copy.date_ids == dict(
+        data_copy.con.execute("SELECT date, id FROM date")
+    )
+    rows = data_copy.con.execute("""
+        SELECT t.symbol, d.date, p.volume
+        FROM price p
+            JOIN ticker t ON p.ticker_id = t.id
+            JOIN date d ON p.date_id = d.id
+        WHERE d.date >= 4102704000
+        ORDER BY t.symbol, d.date
+        """).fetchall()
+    assert rows == [
+        ("AAPL", 4102704000, 100),
+        ("AAPL", 4102790400, 100),
+        ("MSFT", 4102790400, 100),
+    ]
+
+
+def test_reads_during_write(data_copy):
+    assert data_copy.con.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    query = "SELECT * FROM forecast"
+    expected = data_copy.read_con.execute(query).fetchall()
+    result = []
+    reader = threading.Thread(
+        target=lambda: result.append(data_copy.read_con.execute(query).fetchall())
+    )
+    # Readers neither wait for the writer lock nor for an open write transaction
+    with data_copy.lock:
+        data_copy.con.execute("DELETE FROM forecast")
+        reader.start()
+        reader.join(timeout=5)
+        data_copy.con.rollback()
+    # and see the last committed data
+    assert result == [expected] and expected
+
+
+def test_data_version(data_copy):
+    # Another process writing to the same database
+    other = DataStore(data_copy.script_directory)
+    version, rows = data_copy.data_version, len(data_copy.main_table)
+    frame = ohlc_bars()
+    other.insert_ohlc_many({"AAPL": frame})
+
+    # The change is detected and loaded without being forced
+    data_copy.load_main_table(force_update=False)
+    assert data_copy.data_version > version
+    assert len(data_copy.main_table) == rows + 1
+    # Nothing is read while the version is unchanged
+    table = data_copy.main_table
+    data_copy.load_main_table(force_update=False)
+    assert data_copy.main_table is table
+
+
+def test_data_version_published_last(data_copy, monkeypatch):
+    version = data_copy.data_version
+    data_copy.clear_forecasts()
+    seen = []
+    for method in ("set_main_table", "load_forecasts"):
+        original = getattr(DataStore, method)
+        monkeypatch.setattr(
+            DataStore,
+            method,
+            lambda self, *args, original=original, **kwargs: seen.append(
+                self.data_version
+            )
+            or original(self, *args, **kwargs),
+        )
+    data_copy.load_main_table(full=True)
+    # Requests still see the previous version while the table and forecasts are swapped
+    assert seen == [version, version]
+    assert data_copy.data_version > version
+
+
+def test_snapshot(data_copy, monkeypatch):
+    pytest.importorskip("pyarrow")
+    data_copy.write_snapshot()
+    frame = ohlc_bars()
+    data_copy.insert_ohlc_many({"AAPL": frame})
+
+    # A new process starts from the snapshot and reads only the newer row
+    reads = []
+    read_prices = DataStore.read_prices
+    monkeypatch.setattr(
+        DataStore,
+        "read_prices",
+        lambda self, *rowids: reads.append(rowids) or read_prices(self, *rowids),
+    )
+    started = DataStore(data_copy.script_directory)
+    assert reads == [(data_copy.last_rowid, data_copy.last_rowid + 1)]
+    data_copy.load_main_table()
+    pd.testing.assert_frame_equal(started.main_table, data_copy.main_table)
+    assert started.get_symbol_frame("AAPL").date.iat[-1] == pd.Timestamp("2100-01-04")
+
+
+def test_snapshot_mismatch(data_copy, monkeypatch):
+    pytest.importorskip("pyarrow")
+    data_copy.write_snapshot()
+    reads = []
+    read_prices = DataStore.read_prices
+    monkeypatch.setattr(
+        DataStore,
+        "read_prices",
+        lambda self, *rowids: reads.append(rowids) or read_prices(self, *rowids),
+    )
+    # A price row covered by the snapshot was removed
+    with data_copy.con:
+        data_copy.con.execute("DELETE FROM price WHERE rowid = 1")
+    DataStore(data_copy.script_directory)
+    assert reads == [(0, data_copy.last_rowid)]
+    # Another database replaced this one
+    data_copy.write_snapshot()
+    with data_copy.con:
+        data_copy.con.execute("UPDATE data_version SET database_id = 'other'")
+    reads.clear()
+    DataStore(data_copy.script_directory)
+    assert reads == [(0, data_copy.last_rowid)]
+
+
+def test_top_movers(data_copy):
+    expected = (
+        data_copy.main_table.groupby("symbol", observed=True)
+        .close.agg(lambda close: 100 * (close.iat[-1] / close.iat[-2] - 1))
+        .rename(index=str)
+    )
+    movers = data_copy.top_movers(10)
+    # The largest absolute changes, in descending order
+    assert list(movers.index) == list(expected.abs().nlargest(10).index)
+    assert movers.change.to_numpy() == pytest.approx(expected[movers.index].to_numpy())
+    assert data_copy.top_movers(3, by="volume").volume.is_monotonic_decreasing
+    with pytest.raises(ValueError):
+        data_copy.top_movers(by="name")
+
+    # The change follows new bars
+    frame = ohlc_bars(Volume=10**12)
+    previous_close = data_copy.get_symbol_frame("AAPL").close.iat[-1]
+    data_copy.insert_ohlc_many({"AAPL": frame})
+    data_copy.load_main_table()
+    top = data_copy.top_movers(1, by="volume")
+    assert top.index[0] == "AAPL"
+    assert top.change.iat[0] == pytest.approx(100 * (1.5 / previous_close - 1))
+
+
 # Ensure the test database is deleted after testing
 @pytest.fixture(scope="session", autouse=True)
 def test_db_cleanup():
@@ -0,0 +1,116 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from innov8.forecasting import clip_to_margin, future_timestamps, load_engine
+
+
+def clip_reference(history, predicted, periods=5):
+    # Per-series clipping as originally done for each Prophet forecast
+    last_period = np.abs(np.diff(history))[-periods:]
+    last_price = history[-1]
+    s = last_period.sum()
+    price_diffs = np.resize(last_period, periods * 2)
+    predicted = predicted.copy()
+    for i in range(periods):
+        margin = s / periods
+        price = predicted[i].clip(last_price - margin, last_price + margin)
+        price_diffs[i + periods] = abs(price - last_price)
+        last_price = price
+        s = s - price_diffs[i] + price_diffs[i + periods]
+        predicted[i] = price
+    return predicted
+
+
+def test_clip_to_margin():
+    rng = np.random.default_rng(21)
+    history = 100 + rng.normal(0, 1, (20, 30)).cumsum(axis=1)
+    predicted = history[:, -1:] + rng.normal(0, 3, (20, 5))
+    clipped = clip_to_margin(history, predicted)
+    # Verify that all series are clipped exactly like the per-series loop
+    for i in range(len(history)):
+        assert clipped[i] == pytest.approx(clip_reference(history[i], predicted[i]))
+
+
+def test_future_timestamps():
+    # Friday -> the following five business days
+    timestamps = future_timestamps(pd.Timestamp("2024-06-28"))
+    assert [pd.Timestamp(t, unit="s").day_name() for t in timestamps] == [
+        "Monday",
+        "Tuesday",
+        "Wednesday",
+        "Thursday",
+        "Friday",
+    ]
+
+
+def test_load_engine():
+    with pytest.raises(ValueError):
+        load_engine("crystal-ball")
+
+
+def test_smoothing_engine():
+    dates = pd.bdate_range(end="2024-06-28", periods=100)
+    trend = np.linspace(100, 150, len(dates))
+    histories = {
+        "UP": pd.DataFrame(
+            {
+                "date": dates,
+                "open": trend,
+                "high": trend + 1,
+                "low": trend - 1,
+                "close": trend,
+            }
+        ),
+        # A shorter history with a different last date
+        "FLAT": pd.DataFrame(
+            {
+                "date": dates[:50],
+                "open": 10.0,
+                "high": 11.0,
+                "low": 9.0,
+                "close": 10.0,
+            }
+        ),
+    }
+    forecasts = dict(load_engine("smoothing").forecast_many(histories))
+
+    assert set(forecasts) == {"UP", "FLAT"}
+    assert [row[0] for row in forecasts["UP"]] == future_timestamps(dates[-1])
+    assert [row[0] for row in forecasts["FLAT"]] == future_timestamps(dates[49])
+    # The trend is continued, within the bounds of the predicted high and low
+    closes = [row[4] for row in forecasts["UP"]]
+    assert closes == sorted(closes) and closes[0] > trend[-1]
+    for _, open_, high, low, close in forecasts["UP"] + forecasts["FLAT"]:
+        assert low <= min(open_, close) and high >= max(open_, close)
+    assert [row[4] for row in forecasts["FLAT"]] == pytest.approx([10.0] * 5)
+
+
+def test_prophet_warm_start():
+    engine = load_engine("prophet")
+    dates = pd.bdate_range(end="2024-06-28", periods=120)
+    trend = np.linspace(100, 130, len(dates)) + np.sin(np.arange(len(dates)))
+    history = pd.DataFrame(
+        {
+            "date": dates,
+            "open": trend,
+            "high": trend + 1,
+            "low": trend - 1,
+            "close": trend,
+        }
+    )
+    params = {}
+    ((_, cold),) = engine.forecast_many({"UP": history[:-1]}, params=params)
+    assert set(params["UP"]) == {"open", "high", "low", "close"}
+    # Parameters are JSON-serializable, to be stored with the forecasts
+    assert json.loads(json.dumps(params)) == params
+    first = params["UP"]
+
+    # Warm-started from the previous fit, the forecast matches a cold fit
+    ((_, warm),) = engine.forecast_many({"UP": history}, params=params)
+    ((_, expected),) = engine.forecast_many({"UP": history})
+    assert params["UP"] is not first
+    assert [row[0] for row in warm] == [row[0] for row in expected]
+    assert np.array(warm)[:, 1:] == pytest.approx(np.array(expected)[:, 1:], rel=1e-2)
@@ -0,0 +1,200 @@
+import logging
+import threading
+import time
+
+import pandas as pd
+import pytest
+import yfinance as yf
+
+from innov8.ingest import RateLimitError, TokenBucket, YahooProvider, ingest
+from tests.conftest import ohlc_bars
+
+
+class FakeProvider:
+    """Offline stand-in for YahooProvider with simulated latency and rate limiting"""
+
+    def __init__(self, latency=0.01, rate_limited=()):
+        self.latency = latency
+        # Symbols whose first request is rejected with a 429
+        self.rate_limited = set(rate_limited)
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+        self.calls = 0
+        # Symbols requested by each batch download
+        self.batches = []
+
+    def history(self, symbol, start=None):
+        with self.lock:
+            self.calls += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.latency)
+            with self.lock:
+                if symbol in self.rate_limited:
+                    self.rate_limited.remove(symbol)
+                    raise RateLimitError("429 Too Many Requests")
+            # A new daily bar, well after any stored date
+            return ohlc_bars()
+        finally:
+            with self.lock:
+                self.active -= 1
+
+    def download(self, symbols, start=None):
+        with self.lock:
+            self.batches.append(symbols)
+        return {symbol: self.history(symbol, start) for symbol in symbols}
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=50, capacity=1)
+    start = time.monotonic()
+    for _ in range(11):
+        bucket.acquire()
+    # The first token is available immediately, the other 10 at 50 per second
+    assert time.monotonic() - start >= 10 / 50 * 0.9
+
+
+def test_ingest():
+    provider = FakeProvider(latency=0.02, rate_limited={"S1", "S3"})
+    symbols = [f"S{i}" for i in range(20)]
+    written = []
+    writer_threads = set()
+
+    def write(symbol, result):
+        writer_threads.add(threading.get_ident())
+        written.append(symbol)
+
+    stats = ingest(
+        symbols,
+        provider.history,
+        write,
+        workers=4,
+        rate=1000,
+        max_in_flight=6,
+        backoff=0.01,
+    )
+
+    # Every symbol is written exactly once, from a single thread
+    assert sorted(written) == sorted(symbols)
+    assert len(writer_threads) == 1
+    # Rate limited requests are retried
+    assert stats["retries"] == 2 and provider.calls == len(symbols) + 2
+    assert stats["written"] == len(symbols) and stats["failed"] == 0
+    # Concurrency is bounded by the number of workers
+    assert 1 < provider.max_active <= 4
+
+
+def test_ingest_gives_up():
+    provider = FakeProvider(rate_limited={"S0"})
+    stats = ingest(["S0"], provider.history, lambda *_: None, retries=0)
+    assert stats["failed"] == 1 and stats["written"] == 0
+
+
+def test_update_ohlc(data_copy):
+    data_copy.provider = FakeProvider(rate_limited={"AAPL"})
+    symbols = ["AAPL", "MSFT", "IBM"]
+    data_copy.update_ohlc(symbols, backoff=0.01)
+    data_copy.load_main_table()
+
+    # The new bar is stored and loaded for every symbol
+    for symbol in symbols:
+        ticker = data_copy.get_symbol_frame(symbol)
+        assert ticker.date.iat[-1] == pd.Timestamp("2100-01-04")
+        assert ticker.close.iat[-1] == 1.5
+
+
+def test_update_ohlc_chunks(data_copy):
+    data_copy.provider = FakeProvider()
+    symbols = ["AAPL", "MSFT", "IBM", "NVDA", "AMD"]
+    data_copy.update_ohlc(symbols, chunk_size=2)
+    data_copy.load_main_table()
+
+    # Symbols sharing a start date are downloaded in chunks, the odd one out alone
+    assert sorted(map(len, data_copy.provider.batches)) == [2, 2]
+    assert data_copy.provider.calls == len(symbols)
+    for symbol in symbols:
+        assert data_copy.get_symbol_frame(symbol).date.iat[-1] == pd.Timestamp(
+            "2100-01-04"
+        )
+
+
+def test_yahoo_download(monkeypatch):
+    dates = pd.DatetimeIndex(["2024-06-27", "2024-06-28"], name="Date")
+    columns = pd.MultiIndex.from_product(
+        [["AAPL", "MSFT"], ["Open", "High", "Low", "Close", "Volume"]]
+    )
+    wide = pd.DataFrame(1.0, index=dates, columns=columns)
+    # MSFT did not trade on the second day
+    wide.loc[dates[1], "MSFT"] = float("nan")
+    monkeypatch.setattr(yf, "download", lambda *args, **kwargs: wide)
+
+    provider = YahooProvider(None)
+    fallback = []
+
+    def history(symbol, start=None):
+        fallback.append(symbol)
+        if symbol == "GONE":
+            raise ValueError("GONE: possibly delisted; no price data found")
+        return wide["AAPL"].iloc[:1]
+
+    monkeypatch.setattr(provider, "history", history)
+    frames = provider.download(["AAPL", "MSFT", "IBM", "GONE"], "2024-06-27")
+
+    # The wide frame is split per symbol, missing symbols are fetched alone and the
+    # ones that still fail are left out
+    assert sorted(fallback) == ["GONE", "IBM"]
+    assert sorted(frames) == ["AAPL", "IBM", "MSFT"]
+    assert list(frames["AAPL"].columns) == ["Open", "High", "Low", "Close", "Volume"]
+    assert len(frames["AAPL"]) == 2 and len(frames["MSFT"]) == 1
+
+
+def test_yahoo_download_rate_limited(monkeypatch):
+    active, overlaps = [], []
+
+    def download(symbols, **kwargs):
+        active.append(symbols)
+        overlaps.append(len(active))
+        time.sleep(0.02)
+        active.remove(symbols)
+        # Errors of individual symbols are logged, not raised
+        if "AAPL" in symbols:
+            logging.getLogger("yfinance").error(
+                "['AAPL']: YFRateLimitError('Too Many Requests. Rate limited.')"
+            )
+        return pd.DataFrame()
+
+    monkeypatch.setattr(yf, "download", download)
+    provider = YahooProvider(None)
+    monkeypatch.setattr(provider, "history", lambda symbol, start=None: None)
+    with pytest.raises(RateLimitError):
+        provider.download(["AAPL", "MSFT"], "2024-06-27")
+
+    # Batch downloads share yfinance's module state, so they never overlap
+    threads = [
+        threading.Thread(
+            target=provider.download, args=([f"S{i}", "IBM"], "2024-06-27")
+        )
+        for i in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max(overlaps) == 1
+
+
+def test_insert_ohlc_overlap(data_copy):
+    stored = data_copy.get_symbol_frame("AAPL").date.iat[-1]
+    frames = {
+        # A bar that is already stored
+        "AAPL": ohlc_bars(stored),
+        "MSFT": ohlc_bars(),
+    }
+    data_copy.insert_ohlc_many(frames)
+    data_copy.load_main_table()
+
+    # The other symbols of the chunk are still inserted
+    assert data_copy.get_symbol_frame("MSFT").date.iat[-1] == pd.Timestamp("2100-01-04")
+    assert data_copy.get_symbol_frame("AAPL").date.iat[-1] == stored
@@ -0,0 +1,35 @@
+import diskcache
+
+from innov8.payload_cache import PayloadCache
+
+
+def test_payload_cache():
+    cache = PayloadCache("test", maxsize=2)
+    builds = []
+
+    def build(value):
+        return lambda: builds.append(value) or value
+
+    assert cache.get("a", 1, build("a1")) == "a1"
+    assert cache.get("a", 1, build("a2")) == "a1"
+    assert cache.get("b", 1, build("b1")) == "b1"
+    assert cache.get("a", 1, build("a3")) == "a1"
+    # The least recently used entry is evicted
+    cache.get("c", 1, build("c1"))
+    assert cache.get("a", 1, build("a4")) == "a1"
+    assert cache.get("b", 1, build("b2")) == "b2"
+    assert cache.stats() == {"hits": 3, "misses": 4, "size": 2}
+    # A new data version invalidates every entry
+    assert cache.get("a", 2, build("a5")) == "a5"
+    assert cache.stats()["size"] == 1
+    assert builds == ["a1", "b1", "c1", "b2", "a5"]
+
+
+def test_shared_payload_cache(tmp_path):
+    with diskcache.Cache(tmp_path) as shared:
+        cache = PayloadCache("test", shared=shared)
+        assert cache.get("a", 1, lambda: "a1") == "a1"
+        # Another process only has the shared entry
+        other = PayloadCache("test", shared=shared)
+        assert other.get("a", 1, lambda: "a2") == "a1"
+        assert other.get("a", 2, lambda: "a3") == "a3"
@@ -0,0 +1,32 @@
+import subprocess
+import sys
+
+from innov8.profiling import parse_importtime
+
+
+def test_parse_importtime():
+    output = """import time: self [us] | cumulative | imported package
+import time:       120 |        120 |   _io
+import time:      3000 |       3120 | innov8.db_ops
+2024-06-28 | INFO | innov8.db_ops:load_main_table - Loading main table...
+"""
+    # Verify that only timing lines are parsed
+    assert parse_importtime(output) == {
+        "_io": (120, 120),
+        "innov8.db_ops": (3000, 3120),
+    }
+
+
+def test_cli_import_is_cold():
+    # The CLI does not load the app before profile-startup measures it
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, innov8.run; print('innov8.db_ops' in sys.modules)",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.strip() == "False"